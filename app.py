@@ -1,20 +1,31 @@
 
-from fastapi import FastAPI, Request, HTTPException, UploadFile, File
+import time
+IMPORT_STARTED_AT = time.perf_counter()  # для замера времени импорта приложения
+
+from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from modules.voice_io import VoiceIO
 from modules.nlp_processor import NLPProcessor
 from modules.database import DatabaseManager
-from modules.security import SecurityChecker
+from modules.security import SecurityChecker, AdmissionController, AdmissionRejected
+from modules.audio import AudioConverter, AudioDecodeError
+from modules.executors import StageExecutor, StageOverloaded, StageTimeout
+from modules.streaming import StreamingDecoder, VoiceActivityDetector
+from modules.metrics import REGISTRY, timed, server_timing
+from modules.query_cache import QueryCache
+from modules.single_flight import SingleFlight
 from config import Config
-from pydub import AudioSegment
 import os
 import logging
-import tempfile
+import asyncio
 import speech_recognition as sr
 from pathlib import Path
+from pydantic import BaseModel
+from typing import List
+import json
 
 
 # Настройка логирования
@@ -25,25 +36,204 @@ app = FastAPI()
 
 # Инициализация компонентов
 nlp = NLPProcessor()
-db = DatabaseManager()
+db = DatabaseManager(nlp)
 voice_io = VoiceIO()
+executor = StageExecutor.from_config()
+admission = AdmissionController()
+flights = SingleFlight()  # одинаковые одновременные запросы вычисляются один раз
+
+# Фиксированные ответы: озвучиваются заранее при запуске
+TEXT_NOT_FOUND = "К сожалению, я не нашел информации по вашему запросу."
+VOICE_NOT_FOUND = "По вашему запросу ничего не найдено. Уточните вопрос."
+FIXED_REPLIES = [TEXT_NOT_FOUND, VOICE_NOT_FOUND]
+
+# Метрики компонентов снимаются в момент экспорта
+REGISTRY.callback("assistant_query_cache", "Статистика кэша результатов поиска", "event",
+                  db.cache.get_stats)
+REGISTRY.callback("assistant_fuzzy_terms", "Нечеткое сопоставление основ слов запросов", "event",
+                  lambda: db.fuzzy.get_stats() if db.fuzzy is not None else {})
+REGISTRY.callback("assistant_tts_cache", "Статистика кэша синтезированного аудио", "event",
+                  lambda: voice_io.tts.cache.get_stats())
+REGISTRY.callback("assistant_query_log", "Фоновая запись журнала запросов", "event",
+                  lambda: dict(db.log_writer.stats, backlog=db.log_writer.backlog) if db.log_writer else {})
+REGISTRY.callback("assistant_stage_pending", "Задачи в очереди этапов", "stage",
+                  lambda: {name: stats["pending"] for name, stats in executor.get_stats().items()})
+REGISTRY.callback("assistant_admission", "Контроль допуска запросов", "event", admission.get_stats)
+REGISTRY.callback("assistant_single_flight", "Объединение одинаковых одновременных запросов", "event",
+                  flights.get_stats)
 
 # Настройка статических файлов и шаблонов
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Готовность компонентов (/readyz) и длительность этапов запуска, мс
+readiness = {"nlp": False, "db": False, "search_index": False, "asr": False}
+startup_timings = {"import": round((time.perf_counter() - IMPORT_STARTED_AT) * 1000)}
+
+async def warm_db():
+    await asyncio.to_thread(db.warm_up)
+    await asyncio.to_thread(db.check_corpus_version, True)
+    await db.warm_up_async()
+
+def warm_search_index():
+    """Построение поискового индекса (или матрицы TF-IDF) по корпусу документов"""
+    if Config.SEARCH_BACKEND == "index":
+        index = db.build_search_index()
+        logger.info(f"Поисковый индекс построен: {len(index)} документов, {index.term_count} терминов")
+    elif Config.SEARCH_BACKEND == "tfidf":
+        ranker = db.build_ranker()
+        logger.info(f"Матрица TF-IDF построена: {len(ranker)} документов, {len(ranker.vocabulary)} терминов")
+
+async def warm_up():
+    """Фоновый прогрев: запросы принимаются сразу, тяжелые ресурсы загружаются параллельно"""
+    steps = [
+        ("nlp", nlp.load),
+        ("db", warm_db),
+        ("search_index", warm_search_index),
+        ("asr", voice_io.asr.warm_up),
+    ]
+    delay = Config.WARM_UP_RETRY_DELAY
+    prerendered = False
+    while True:
+        failed = []
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(step):
+                    await step()
+                else:
+                    await asyncio.to_thread(step)
+                readiness[name] = True
+            except Exception as e:
+                logger.error(f"Ошибка прогрева {name}: {e}", exc_info=True)
+                failed.append((name, step))
+            startup_timings[name] = round((time.perf_counter() - started) * 1000)
+        
+        if not prerendered:
+            # Заблаговременная озвучка фиксированных ответов
+            voice_io.tts.prerender(FIXED_REPLIES)
+            prerendered = True
+        if not failed:
+            break
+        
+        # Неудавшиеся этапы (БД недоступна, нет данных NLTK) повторяются, пока не пройдут:
+        # иначе /readyz отвечал бы 503 до перезапуска процесса
+        logger.warning(f"Повтор прогрева {[name for name, _ in failed]} через {delay} с")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, Config.WARM_UP_RETRY_MAX_DELAY)
+        steps = failed
+    logger.info(f"Прогрев завершен: {readiness}, {startup_timings} мс")
+
 @app.on_event("startup")
 async def startup_event():
-    """Инициализация при запуске"""
-    # Воспроизведение приветственного звука
-    voice_io.play_notification_sound("start")
+    """Инициализация при запуске: только быстрые шаги, остальное - в фоновом прогреве"""
+    started = time.perf_counter()
+    
+    # Фоновая запись журнала запросов и синтез речи
+    db.start_log_writer()
+    voice_io.tts.start()
+    
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+    startup_timings["startup"] = round((time.perf_counter() - started) * 1000)
+    logger.info(f"Импорт приложения: {startup_timings['import']} мс, запуск: {startup_timings['startup']} мс")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Завершение работы: дозапись журнала запросов"""
+    executor.shutdown(wait=False)
+    app.state.warm_up_task.cancel()
+    db.stop_log_writer()
+    await db.dispose_async()
+    voice_io.tts.stop()
+    stats = db.log_writer.stats if db.log_writer else {}
+    logger.info(f"Журнал запросов: {stats}")
+    logger.info(f"Кэш поиска: {db.cache.get_stats()}")
+    logger.info(f"Кэш синтеза речи: {voice_io.tts.cache.get_stats()}")
+    logger.info(f"Объединение запросов: {flights.get_stats()}")
+
+@app.exception_handler(StageOverloaded)
+async def stage_overloaded_handler(request: Request, exc: StageOverloaded):
+    """Обратное давление: очередь этапа заполнена"""
+    logger.warning(str(exc))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Сервис перегружен, повторите запрос позже"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def admission_response(exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return admission_response(exc)
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Ранний отказ до разбора тела запроса: частота клиента, одновременные запросы, размер"""
+    endpoint = request.url.path
+    if endpoint not in Config.MAX_INFLIGHT and endpoint not in Config.RATE_LIMITED_PATHS:
+        return await call_next(request)
+    # Потоковый ответ возвращается до окончания обработки: его слот удерживает сам обработчик
+    hold = endpoint not in Config.STREAMING_PATHS
+    try:
+        content_length = request.headers.get("content-length")
+        size = int(content_length) if content_length else None
+        if endpoint == "/process_batch":
+            admission.check_batch(size)
+        else:
+            admission.check_upload(size=size)
+        if not hold:
+            admission.check_capacity(endpoint)
+        admission.acquire(endpoint, request.client.host if request.client else None,
+                          endpoint in Config.RATE_LIMITED_PATHS, hold)
+    except AdmissionRejected as e:
+        logger.warning(f"Отказ в допуске {endpoint}: {e.detail}")
+        return admission_response(e)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "Некорректный заголовок Content-Length"})
+    try:
+        return await call_next(request)
+    finally:
+        if hold:
+            admission.release(endpoint)
+
+@app.exception_handler(StageTimeout)
+async def stage_timeout_handler(request: Request, exc: StageTimeout):
+    logger.warning(str(exc))
+    return JSONResponse(status_code=504, content={"detail": "Превышено время обработки запроса"})
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """Главная страница с интерфейсом помощника"""
     return templates.TemplateResponse("index.html", {"request": request})
 
-async def process_text_query(query_text: str):
+def passage_text(match: dict) -> str:
+    """Текст наиболее подходящего фрагмента найденного документа"""
+    passage = match.get("passage")
+    return passage["text"] if passage else ""
+
+async def search_documents(tokens, category_code=None, doc_type_code=None):
+    """Поиск: асинхронно через пул asyncpg (DB_ASYNC) или в пуле потоков этапа db"""
+    if db.async_search:
+        return await db.search_documents_async(tokens, category_code, doc_type_code)
+    return await executor.run("db", db.search_documents, tokens, category_code, doc_type_code)
+
+async def classify_and_search(tokens: List[str]):
+    """Классификация и поиск по основам слов: одинаковые одновременные запросы
+    ожидают одно общее вычисление"""
+    async def compute():
+        nlp_result = nlp.classify_tokens(tokens)
+        search_results = await search_documents(nlp_result["tokens"], nlp_result["category"], nlp_result["doc_type"])
+        return nlp_result, search_results
+    
+    return await flights.run(QueryCache.make_key(tokens), compute)
+
+async def process_text_query(query_text: str, timings: dict = None):
     """Обработка текстового запроса"""
     # Проверка безопасности
     is_valid, validation_result = SecurityChecker.validate_query(query_text)
@@ -52,100 +242,348 @@ async def process_text_query(query_text: str):
     
     query_text = validation_result
     
-    # NLP-обработка
-    nlp_result = nlp.classify_query(query_text)
-    logger.info(f"NLP результат: {nlp_result}")
+    # Нормализация: основы слов - ключ объединения одинаковых запросов
+    with timed("nlp", timings):
+        tokens = await executor.run("nlp", nlp.preprocess_text, query_text)
     
-    # Поиск в базе данных
-    search_results = db.search_documents(
-        nlp_result["tokens"],
-        nlp_result["category"],
-        nlp_result["doc_type"]
-    )
+    # Классификация и поиск в базе данных
+    with timed("search", timings):
+        nlp_result, search_results = await classify_and_search(tokens)
+    logger.debug(f"NLP результат: {nlp_result}")
     
     # Формирование ответа
+    response = text_response(nlp_result, search_results)
+    
+    # Логирование запроса (для каждого запроса, в том числе объединенного)
+    with timed("log", timings):
+        db.log_query(**log_record(query_text, nlp_result, response))
+    
+    return response
+
+def text_response(nlp_result: dict, search_results: list) -> dict:
+    """Ответ на текстовый запрос по лучшему найденному документу"""
     if not search_results:
-        response = {
-            "text": "К сожалению, я не нашел информации по вашему запросу.",
+        return {
+            "text": TEXT_NOT_FOUND,
             "document": None,
             "query_code": nlp_result.get("query_code")
         }
-    else:
-        best_match = search_results[0]
-        response = {
-            "text": f"По вашему запросу найдено: {best_match['title']}\n\n{best_match['content'][:500]}...",
-            "document": {
-                "id": best_match["id"],
-                "title": best_match["title"],
-                "url": best_match["url"]
-            },
-            "query_code": nlp_result.get("query_code")
-        }
+    best_match = search_results[0]
+    return {
+        "text": f"По вашему запросу найдено: {best_match['title']}\n\n{passage_text(best_match)}",
+        "document": {
+            "id": best_match["id"],
+            "title": best_match["title"],
+            "url": best_match["url"]
+        },
+        "passage": best_match.get("passage"),
+        "query_code": nlp_result.get("query_code")
+    }
+
+def log_record(query_text: str, nlp_result: dict, response: dict) -> dict:
+    return {
+        "query_text": query_text,
+        "category_code": nlp_result.get("category", "UNK"),
+        "response_text": response["text"],
+        "document_id": response["document"]["id"] if response["document"] else None
+    }
+
+async def process_text_batch(queries: List[str]) -> List[dict]:
+    """Обработка пачки текстовых запросов: общая классификация, сгруппированный поиск
+    и запись журнала одной транзакцией. Ответы идут в порядке запросов"""
+    responses = [None] * len(queries)
+    valid = []  # (позиция, очищенный текст)
+    for position, query_text in enumerate(queries):
+        is_valid, validation_result = SecurityChecker.validate_query(query_text)
+        if is_valid:
+            valid.append((position, validation_result))
+        else:
+            responses[position] = {"error": validation_result}
     
-    # Логирование запроса
-    db.log_query(
-        query_text=query_text,
-        category_code=nlp_result.get("category", "UNK"),
-        response_text=response["text"],
-        document_id=response["document"]["id"] if response["document"] else None
-    )
+    if valid:
+        texts = [query_text for _, query_text in valid]
+        with timed("nlp_batch"):
+            nlp_results = await executor.run("nlp", nlp.classify_batch, texts)
+        with timed("search_batch"):
+            search_results = await executor.run(
+                "db",
+                db.search_batch,
+                [(result["tokens"], result["category"], result["doc_type"]) for result in nlp_results]
+            )
+        
+        records = []
+        for (position, query_text), nlp_result, results in zip(valid, nlp_results, search_results):
+            responses[position] = text_response(nlp_result, results)
+            records.append(log_record(query_text, nlp_result, responses[position]))
+        with timed("log_batch"):
+            await executor.run("db", db.log_queries, records)
     
-    return response
+    return [dict(response, index=position) for position, response in enumerate(responses)]
+
+
+class BatchRequest(BaseModel):
+    queries: List[str]
+
+@app.post("/process_batch")
+async def process_batch(batch: BatchRequest):
+    """Пакетная обработка текстовых запросов; ответы передаются потоком NDJSON по мере готовности частей"""
+    if len(batch.queries) > Config.MAX_BATCH_SIZE:
+        raise HTTPException(413, detail=f"Не более {Config.MAX_BATCH_SIZE} запросов в пакете")
+    
+    async def stream():
+        # Слот занимается на все время обработки пакета, а не до отправки заголовков
+        try:
+            admission.acquire("/process_batch", rate_limited=False)
+        except AdmissionRejected as e:
+            yield json.dumps({"error": e.detail, "index": 0}, ensure_ascii=False) + "\n"
+            return
+        try:
+            for start in range(0, len(batch.queries), Config.BATCH_CHUNK_SIZE):
+                chunk = batch.queries[start:start + Config.BATCH_CHUNK_SIZE]
+                try:
+                    responses = await process_text_batch(chunk)
+                except (StageOverloaded, StageTimeout) as e:
+                    logger.warning(str(e))
+                    yield json.dumps({"error": "Сервис перегружен, повторите запрос позже", "index": start}) + "\n"
+                    return
+                for response in responses:
+                    response["index"] += start
+                    yield json.dumps(response, ensure_ascii=False) + "\n"
+        finally:
+            admission.release("/process_batch")
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def answer_voice_query(query_text: str, timings: dict = None) -> dict:
+    """NLP-обработка и поиск по распознанному тексту"""
+    # Улучшенная обработка NLP
+    with timed("nlp", timings):
+        tokens = await executor.run("nlp", nlp.preprocess_text, query_text) if query_text else []
+    
+    if not tokens:
+        raise HTTPException(400, detail="Не удалось определить тему запроса")
+    
+    # Поиск с учетом морфологии
+    with timed("search", timings):
+        nlp_result, search_results = await classify_and_search(tokens)
+    logger.debug(f"NLP результат: {nlp_result}")
+    
+    if not search_results:
+        return {
+            "text": VOICE_NOT_FOUND,
+            "document": None
+        }
+    
+    best_match = search_results[0]
+    return {
+        "text": f"Найдено: {best_match['title']}\n{passage_text(best_match)}",
+        "document": {
+            "id": best_match["id"],
+            "title": best_match["title"],
+            "url": best_match["url"]
+        },
+        "passage": best_match.get("passage")
+    }
 
 
 @app.post("/process_voice")
-async def process_voice(audio_data: UploadFile = File(...)):
+async def process_voice(audio_data: UploadFile = File(...), duration: float = Form(None)):
+    timings = {}
     try:
-        # Конвертация и обработка аудио
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp:
-            audio = AudioSegment.from_file(audio_data.file)
-            audio.set_channels(1).set_frame_rate(16000).export(tmp.name, format="wav")
+        # Заявленная клиентом длительность проверяется до декодирования
+        admission.check_upload(duration=duration)
+        
+        # Чтение загрузки с ограничением размера
+        raw_audio = await audio_data.read(Config.MAX_AUDIO_BYTES + 1)
+        if len(raw_audio) > Config.MAX_AUDIO_BYTES:
+            raise HTTPException(413, detail="Слишком большой аудиофайл")
+        
+        # Конвертация аудио в памяти, без временных файлов
+        try:
+            with timed("audio", timings):
+                pcm = await executor.run("audio", AudioConverter.decode_to_pcm, raw_audio)
+        except AudioDecodeError as e:
+            logger.warning(f"Ошибка декодирования аудио: {e}")
+            raise HTTPException(400, detail="Не удалось декодировать аудио")
+        del raw_audio
+        audio = AudioConverter.to_audio_data(pcm)
+        
+        try:
+            with timed("asr", timings):
+                query_text = await executor.run("asr", voice_io.transcribe, audio)
+            logger.info(f"Распознанный текст: {query_text}")
+            response = await answer_voice_query(query_text, timings)
+            headers = {"Server-Timing": server_timing(timings)} if Config.SERVER_TIMING else None
+            return JSONResponse(response, headers=headers)
             
-            with sr.AudioFile(tmp.name) as source:
-                audio_data = voice_io.recognizer.record(source)
-                try:
-                    query_text = voice_io.recognizer.recognize_google(audio_data, language="ru-RU")
-                    logger.info(f"Распознанный текст: {query_text}")
-                    
-                    # Улучшенная обработка NLP
-                    nlp_result = nlp.classify_query(query_text)
-                    logger.info(f"NLP результат: {nlp_result}")
-                    
-                    if not nlp_result['tokens']:
-                        raise HTTPException(400, detail="Не удалось определить тему запроса")
-                    
-                    # Поиск с учетом морфологии
-                    search_results = db.search_documents(
-                        nlp_result["tokens"],
-                        nlp_result["category"],
-                        nlp_result["doc_type"]
-                    )
-                    
-                    if not search_results:
-                        return JSONResponse({
-                            "text": "По вашему запросу ничего не найдено. Уточните вопрос.",
-                            "document": None
-                        })
-                    
-                    best_match = search_results[0]
-                    return JSONResponse({
-                        "text": f"Найдено: {best_match['title']}\n{best_match['content'][:300]}...",
-                        "document": {
-                            "id": best_match["id"],
-                            "title": best_match["title"],
-                            "url": best_match["url"]
-                        }
-                    })
-                    
-                except sr.UnknownValueError:
-                    raise HTTPException(400, detail="Не удалось распознать речь")
-                except sr.RequestError as e:
-                    raise HTTPException(500, detail=f"Ошибка сервиса распознавания: {e}")
-                
+        except sr.UnknownValueError:
+            raise HTTPException(400, detail="Не удалось распознать речь")
+        except sr.RequestError as e:
+            raise HTTPException(500, detail=f"Ошибка сервиса распознавания: {e}")
+    
+    except (HTTPException, AdmissionRejected, StageOverloaded, StageTimeout):
+        raise
     except Exception as e:
         logger.error(f"Ошибка обработки: {str(e)}", exc_info=True)
         raise HTTPException(500, detail="Внутренняя ошибка сервера")
     
+async def recognize_pcm(pcm: bytes) -> str:
+    audio = AudioConverter.to_audio_data(pcm)
+    return await executor.run("asr", voice_io.transcribe, audio)
+
+@app.websocket("/ws/voice")
+async def voice_stream(websocket: WebSocket):
+    """Потоковое распознавание: фрагменты записи поступают по мере записи"""
+    await websocket.accept()
+    client = websocket.client.host if websocket.client else None
+    try:
+        admission.acquire("/ws/voice", client)
+    except AdmissionRejected as e:
+        await websocket.send_json({"type": "error", "detail": e.detail, "retry_after": e.retry_after})
+        await websocket.close(code=1013)
+        return
+    decoder = await StreamingDecoder().start()
+    vad = VoiceActivityDetector()
+    pcm = bytearray()
+    max_pcm_bytes = Config.MAX_AUDIO_SECONDS * AudioConverter.SAMPLE_RATE * AudioConverter.SAMPLE_WIDTH
+    partial_step = int(Config.STREAM_PARTIAL_INTERVAL * AudioConverter.SAMPLE_RATE * AudioConverter.SAMPLE_WIDTH)
+    speculative = {}  # распознанный текст -> задача поиска
+    partial_task = None
+    
+    async def send_partial(snapshot: bytes):
+        """Промежуточное распознавание и упреждающий поиск"""
+        try:
+            text = await recognize_pcm(snapshot)
+        except (sr.UnknownValueError, sr.RequestError, StageOverloaded, StageTimeout):
+            return
+        await websocket.send_json({"type": "partial", "text": text})
+        if text not in speculative:
+            speculative[text] = asyncio.create_task(answer_voice_query(text))
+    
+    async def consume_pcm():
+        nonlocal partial_task
+        next_partial = partial_step
+        async for chunk in decoder.iter_pcm():
+            pcm.extend(chunk)
+            if vad.feed(chunk) or len(pcm) >= max_pcm_bytes:
+                return
+            if vad.in_speech and len(pcm) >= next_partial and (partial_task is None or partial_task.done()):
+                next_partial = len(pcm) + partial_step
+                partial_task = asyncio.create_task(send_partial(bytes(pcm)))
+    
+    async def receive_audio():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                if not await decoder.feed(message["bytes"]):
+                    return  # декодер завершился: обрабатывается то, что успели декодировать
+            elif message.get("text") == "stop":
+                await decoder.close_input()
+                return
+    
+    consumer = asyncio.create_task(consume_pcm())
+    receiver = asyncio.create_task(receive_audio())
+    try:
+        # Ждем конца речи (VAD) или конца потока; обрыв соединения прерывает ожидание.
+        # Общий срок сеанса не дает молчащим клиентам занимать слоты /ws/voice
+        deadline = time.monotonic() + Config.STREAM_SESSION_TIMEOUT
+        done, _ = await asyncio.wait({consumer, receiver}, timeout=Config.STREAM_SESSION_TIMEOUT,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            raise asyncio.TimeoutError
+        if receiver in done:
+            receiver.result()
+            await asyncio.wait_for(consumer, max(0.0, deadline - time.monotonic()))
+        speech_ended_at = time.monotonic()
+        await websocket.send_json({"type": "end_of_speech"})
+        if not pcm:
+            await websocket.send_json({"type": "error", "detail": "Не удалось декодировать аудио"})
+            return
+        
+        try:
+            query_text = await recognize_pcm(bytes(pcm))
+        except sr.UnknownValueError:
+            await websocket.send_json({"type": "error", "detail": "Не удалось распознать речь"})
+            return
+        except sr.RequestError as e:
+            await websocket.send_json({"type": "error", "detail": f"Ошибка сервиса распознавания: {e}"})
+            return
+        logger.info(f"Распознанный текст: {query_text}")
+        
+        # Если окончательный текст совпал с промежуточным, поиск уже выполнен
+        task = speculative.pop(query_text, None)
+        try:
+            response = await task if task is not None else await answer_voice_query(query_text)
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            return
+        
+        latency_ms = (time.monotonic() - speech_ended_at) * 1000
+        logger.info(f"Ответ через {latency_ms:.0f} мс после конца речи (упреждающий поиск: {task is not None})")
+        await websocket.send_json({"type": "final", "query": query_text, "latency_ms": round(latency_ms), **response})
+    except WebSocketDisconnect:
+        logger.info("Клиент отключился во время потокового распознавания")
+    except asyncio.TimeoutError:
+        logger.warning("Истек срок сеанса потокового распознавания")
+        await websocket.send_json({"type": "error", "detail": "Превышено время ожидания записи"})
+    except (StageOverloaded, StageTimeout) as e:
+        logger.warning(str(e))
+        await websocket.send_json({"type": "error", "detail": "Сервис перегружен, повторите запрос позже"})
+    finally:
+        for task in [consumer, receiver, partial_task, *speculative.values()]:
+            if task is not None and not task.done():
+                task.cancel()
+        await decoder.terminate()
+        admission.release("/ws/voice")
+        if websocket.client_state.name == "CONNECTED":
+            await websocket.close()
+
+@app.get("/tts")
+async def synthesize_speech(text: str):
+    """Озвученный ответ в виде аудио (WAV); повторные ответы берутся из кэша"""
+    text = text.strip()[:Config.TTS_MAX_TEXT_LENGTH]
+    if not text:
+        raise HTTPException(400, detail="Пустой текст")
+    try:
+        audio = await asyncio.wrap_future(voice_io.synthesize(text))
+    except StageOverloaded:
+        raise
+    except Exception as e:
+        logger.warning(f"Ошибка синтеза речи: {e}")
+        raise HTTPException(503, detail="Синтез речи недоступен")
+    return Response(content=audio, media_type="audio/wav", headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/healthz", response_class=JSONResponse)
+async def healthz():
+    """Проверка живости процесса"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Готовность к обслуживанию: ресурсы NLP, пул БД и поисковые структуры прогреты"""
+    ready = all(readiness.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "components": readiness, "startup_ms": startup_timings}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики в формате Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/asr_stats", response_class=JSONResponse)
+async def asr_stats():
+    """Задержка распознавания для текущего движка"""
+    return voice_io.asr.get_stats()
+
+@app.get("/admission_stats", response_class=JSONResponse)
+async def admission_stats():
+    return admission.get_stats()
+
 @app.get("/toggle_voice", response_class=JSONResponse)
 async def toggle_voice(enable: bool = True):
     """Переключение голосовой озвучки"""
@@ -0,0 +1,242 @@
+"""Нагрузочный бенчмарк конвейера: классификация, поиск, текстовый и голосовой запрос
+
+Корпус из data/scraped_data/scraped_data.json загружается во временную БД (SQLite
+по умолчанию) и размножается в --scale раз. Распознавание речи - заглушка (stub).
+
+Пример:
+    python -m benchmarks.bench_pipeline --scale 100 --queries 500
+    python -m benchmarks.bench_pipeline --scale 10 --baseline benchmarks/results/prev.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import math
+import random
+import re
+import struct
+import subprocess
+import tempfile
+import time
+import wave
+from pathlib import Path
+from config import Config
+from benchmarks.bench_loader import run as load_corpus, scaled_records
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+QUERY_TEMPLATES = [
+    "как получить {}",
+    "где найти {}",
+    "что такое {}",
+    "порядок оформления {}",
+    "документы по теме {}",
+    "{}",
+    "{} 2023 год",
+]
+FIXED_QUERIES = [
+    "Как получить субсидию для малого бизнеса?",
+    "Нормативные акты по налогам",
+    "Статистика ВВП за 2023 год",
+    "Какие есть программы поддержки?",
+    "закон о государственном бюджете",
+    "отчет о численности населения",
+]
+
+
+def make_queries(count, seed=0):
+    """Смесь запросов: шаблоны с фразами из заголовков корпуса и типичные вопросы"""
+    rng = random.Random(seed)
+    phrases = []
+    for record in scaled_records(1):
+        words = re.findall(r"[а-яё]{4,}", record["title"].lower())
+        for size in (1, 2, 3):
+            phrases.extend(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    queries = []
+    for _ in range(count):
+        if phrases and rng.random() < 0.8:
+            queries.append(rng.choice(QUERY_TEMPLATES).format(rng.choice(phrases)))
+        else:
+            queries.append(rng.choice(FIXED_QUERIES))
+    return queries
+
+
+def make_wav(seconds=2.0, frequency=220.0):
+    """Тестовая запись: тон в формате WAV 16 кГц моно"""
+    rate = 16000
+    samples = (int(8000 * math.sin(2 * math.pi * frequency * i / rate)) for i in range(int(rate * seconds)))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"".join(struct.pack("<h", sample) for sample in samples))
+    return buffer.getvalue()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else None,
+        "qps": round(len(values) / wall_seconds, 1) if wall_seconds else None,
+    }
+
+
+def bench_sync(fn, items):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for item in items:
+        start = time.perf_counter()
+        try:
+            fn(item)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def bench_async(fn, items, concurrency):
+    """Запросы выполняются параллельно, не более concurrency одновременно"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(item):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await fn(item)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(db_url, scale, query_count, concurrency, voice_requests, snapshot_dir):
+    load_stats = load_corpus(db_url, scale)
+
+    # Компоненты приложения создаются при импорте: настройки подменяются заранее
+    Config.DB_URL = db_url
+    Config.INDEX_SNAPSHOT_DIR = snapshot_dir  # снимки временной БД не смешиваются с рабочими
+    Config.ASR_BACKEND = "stub"
+    Config.RATE_LIMITED_PATHS = set()
+    Config.MAX_INFLIGHT = {}
+    import app as service
+    from fastapi.testclient import TestClient
+    logging.getLogger().setLevel(logging.WARNING)
+
+    queries = make_queries(query_count)
+    results = {}
+    with TestClient(service.app) as client:
+        # Прогрев выполняется в фоне: замеры начинаются после готовности
+        deadline = time.monotonic() + 300
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        # Кэши основ и меток после прогрева сбрасываются: замер не сводится к попаданиям в кэш
+        if service.nlp.ready:
+            service.nlp.stem.cache_clear()
+            service.nlp.token_labels.cache_clear()
+        results["classify_query"] = bench_sync(service.nlp.classify_query, queries)
+
+        nlp_results = [service.nlp.classify_query(query) for query in queries]
+        service.db.cache.clear()
+        results["search_documents"] = bench_sync(
+            lambda r: service.db.search_documents(r["tokens"], r["category"], r["doc_type"]), nlp_results)
+        results["search_documents_cached"] = bench_sync(
+            lambda r: service.db.search_documents(r["tokens"], r["category"], r["doc_type"]), nlp_results)
+
+        service.db.cache.clear()
+        results["process_text_query"] = asyncio.run(
+            bench_async(service.process_text_query, queries, concurrency))
+
+        audio = make_wav()
+
+        def post_voice(_):
+            response = client.post("/process_voice", files={"audio_data": ("query.wav", audio, "audio/wav")})
+            response.raise_for_status()
+
+        results["process_voice"] = bench_sync(post_voice, range(voice_requests))
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scale": scale,
+        "documents": load_stats["documents"],
+        "db": load_stats["db"],
+        "search_backend": Config.SEARCH_BACKEND,
+        "queries": query_count,
+        "concurrency": concurrency,
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    """Изменение p95 и QPS относительно сохраненного прогона"""
+    lines = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("p95_ms") or not current.get("p95_ms"):
+            continue
+        p95_delta = (current["p95_ms"] / previous["p95_ms"] - 1) * 100
+        qps_delta = (current["qps"] / previous["qps"] - 1) * 100 if previous.get("qps") else 0.0
+        lines.append(f"{name:26} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} мс ({p95_delta:+.1f}%)"
+                     f"  QPS {qps_delta:+.1f}%")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10, help="Во сколько раз размножить корпус (10-1000)")
+    parser.add_argument("--queries", type=int, default=300, help="Количество запросов в смеси")
+    parser.add_argument("--concurrency", type=int, default=8, help="Параллельных запросов в process_text_query")
+    parser.add_argument("--voice-requests", type=int, default=30)
+    parser.add_argument("--db-url", default=None, help="Целевая БД (таблицы будут пересозданы!); по умолчанию временный SQLite")
+    parser.add_argument("--output", default=None, help="Файл результатов (по умолчанию benchmarks/results/)")
+    parser.add_argument("--baseline", default=None, help="Предыдущий файл результатов для сравнения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_url = args.db_url or f"sqlite:///{Path(tmp_dir) / 'bench_pipeline.db'}"
+        report = run(db_url, args.scale, args.queries, args.concurrency, args.voice_requests,
+                     str(Path(tmp_dir) / "search_index"))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(json.dumps(report["results"], ensure_ascii=False, indent=2))
+    print(f"Результаты сохранены: {output}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        print(compare(report, baseline))
+
+
+if __name__ == "__main__":
+    main()
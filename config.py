@@ -15,15 +15,128 @@ class Config:
     DB_USER = os.getenv("DB_USER", "postgres")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
     DB_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"  # асинхронные запросы поиска через asyncpg
+    DB_ASYNC_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT = 10  # секунды ожидания свободного соединения
+    DB_POOL_RECYCLE = 1800  # секунды
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_CACHE_SIZE = 500  # кэш скомпилированных и подготовленных запросов
   
     # NLP settings
     STOP_WORDS = ["и", "в", "на", "о", "с", "по", "для"]
+    STEM_CACHE_SIZE = 50000
+    
+    # Общая таблица ключевых основ для классификации запросов и документов
+    KEYWORD_PATTERNS = {
+        "category": {
+            "FIS": ["финанс", "поддержк", "субсид", "грант", "бюджет"],
+            "LAW": ["закон", "норматив", "постановлени", "правов", "регулирован"],
+            "STA": ["статистик", "данн", "отчет", "показател", "ввп", "экономик"]
+        },
+        "doc_type": {
+            "03": ["закон", "постановлени", "приказ", "норматив", "правов"],
+            "12": ["статистик", "отчет", "данн", "показател", "анализ"],
+            "07": ["методич", "рекомендац", "инструкц", "руководств", "правил"]
+        }
+    }
+
+    # Search settings
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "index")  # index | tfidf | fts | ilike
+    FTS_CONFIG = "russian"
+    SEARCH_LIMIT = 5
+    BM25_K1 = 1.5
+    BM25_B = 0.75
+    TITLE_WEIGHT = 2  # Заголовок учитывается с повышенным весом
+    PASSAGE_MAX_CHARS = 400  # Размер фрагмента, возвращаемого в ответе
+    
+    # Нечеткое сопоставление основ слов по триграммам (опечатки, ошибки распознавания речи)
+    FUZZY_MATCHING = os.getenv("FUZZY_MATCHING", "1") == "1"
+    FUZZY_THRESHOLD = 0.4  # минимальное сходство триграмм (общие / все различные)
+    FUZZY_MIN_LENGTH = 4  # более короткие основы не исправляются
+    FUZZY_CACHE_SIZE = 10000
+    
+    # Снимок поискового индекса, разделяемый воркерами через mmap (пустая строка - отключено)
+    INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", str(Path(__file__).parent / "data" / "search_index"))
+    INDEX_BUILD_LOCK_TIMEOUT = 600  # секунды; флаг построения снимка старше считается брошенным
+    
+    # Query cache settings
+    QUERY_CACHE_SIZE = 2048
+    QUERY_CACHE_TTL = 600  # секунды
+    CORPUS_VERSION_CHECK_INTERVAL = 30  # секунды
+    
+    # Scraper settings
+    SCRAPER_CONCURRENCY = 8
+    SCRAPER_HOST_RATE = 4.0  # запросов в секунду к одному хосту
+    SCRAPER_HOST_BURST = 4
+    SCRAPER_TIMEOUT = 10  # секунды
+    SCRAPER_CHECKPOINT_EVERY = 20  # страниц между контрольными точками
+    DB_LOAD_BATCH_SIZE = 1000
+    
+    # Query log settings
+    LOG_QUEUE_SIZE = 10000
+    LOG_BATCH_SIZE = 200
+    LOG_FLUSH_INTERVAL = 1.0  # секунды
     
     # Voice settings
     VOICE_ENABLED = True
     VOICE_RATE = 150
     VOICE_VOLUME = 0.9
+    TTS_QUEUE_SIZE = 64
+    TTS_CACHE_MAX_BYTES = 64 * 1024 * 1024  # суммарный размер кэша синтезированного аудио
+    TTS_MAX_TEXT_LENGTH = 1000
+    
+    # Speech recognition settings
+    ASR_BACKEND = os.getenv("ASR_BACKEND", "google")  # google | vosk | stub
+    ASR_LANGUAGE = "ru-RU"
+    VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-ru-0.22")
+    ASR_STUB_TEXT = "субсидии для малого бизнеса"
+    
+    # Audio settings
+    FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+    MAX_AUDIO_BYTES = 10 * 1024 * 1024
+    MAX_AUDIO_SECONDS = 30
+    AUDIO_DECODE_TIMEOUT = 15  # секунды
+    
+    # Streaming settings
+    STREAM_PARTIAL_INTERVAL = 1.5  # секунды записи между промежуточными распознаваниями
+    STREAM_SESSION_TIMEOUT = MAX_AUDIO_SECONDS + 10  # секунды от подключения до конца записи
+    VAD_FRAME_MS = 30
+    VAD_ENERGY_THRESHOLD = 300
+    VAD_SILENCE_MS = 800
+    VAD_MIN_SPEECH_MS = 200
+    
+    # Batch settings
+    MAX_BATCH_SIZE = 10000
+    MAX_BATCH_BYTES = 16 * 1024 * 1024  # размер тела пакетного запроса
+    BATCH_CHUNK_SIZE = 500  # запросов на один проход конвейера и одну транзакцию журнала
+    ILIKE_BATCH_SIZE = 50  # запросов ILIKE в одном UNION ALL (лимиты параметров и составных SELECT в SQLite)
+    
+    # Startup settings: повтор неудавшихся этапов прогрева с экспоненциальной задержкой
+    WARM_UP_RETRY_DELAY = 1.0  # секунды
+    WARM_UP_RETRY_MAX_DELAY = 60.0
+    
+    # Metrics settings
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # заголовок Server-Timing с таймингами этапов
+    
+    # Execution settings: отдельный ограниченный пул на каждый этап конвейера
+    EXECUTOR_STAGES = {
+        # ffmpeg уже работает в отдельном процессе, поэтому декодированию достаточно потоков
+        "audio": {"kind": "thread", "workers": 4, "max_pending": 16, "timeout": 20},
+        "asr": {"kind": "thread", "workers": 8, "max_pending": 32, "timeout": 30},
+        "nlp": {"kind": "thread", "workers": 4, "max_pending": 64, "timeout": 5},
+        "db": {"kind": "thread", "workers": 8, "max_pending": 64, "timeout": 10},
+    }
     
     # Security settings
     MAX_QUERY_LENGTH = 500
-    ALLOWED_CHARS = set("абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯabcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -,.:;!?()")
\ No newline at end of file
+    ALLOWED_CHARS = set("абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯabcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -,.:;!?()")
+    
+    # Admission control: лимиты проверяются до чтения и декодирования загрузки
+    CLIENT_RATE = 0.5  # запросов в секунду от одного клиента
+    CLIENT_BURST = 5
+    MAX_TRACKED_CLIENTS = 10000
+    RATE_LIMITED_PATHS = {"/process_voice", "/ws/voice", "/process_batch"}
+    STREAMING_PATHS = {"/process_batch"}  # слот занимает сам обработчик на все время передачи ответа
+    MAX_INFLIGHT = {"/process_voice": 16, "/ws/voice": 8, "/tts": 16, "/process_batch": 4}  # одновременных запросов на эндпоинт
\ No newline at end of file
@@ -1,9 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Index, insert, update, delete, func, cast, literal, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import TSVECTOR, REGCONFIG
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from config import Config
+from modules.passages import split_passages
+from itertools import islice
+from pathlib import Path
+import csv
+import io
 import os
 import json
+import time
+import uuid
 
 Base = declarative_base()
 
@@ -33,14 +42,47 @@ class Document(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
-    url = Column(String(255), nullable=False)
+    url = Column(String(255), nullable=False, unique=True)
     type_id = Column(Integer, ForeignKey('document_types.id'))
     category_id = Column(Integer, ForeignKey('document_categories.id'))
     access_id = Column(Integer, ForeignKey('access_levels.id'))
+    # Данные для инкрементального обхода: условные запросы и хеш содержимого
+    etag = Column(String(255))
+    last_modified = Column(String(64))
+    content_hash = Column(String(64))
+    outlinks = Column(Text)  # JSON-список ссылок страницы: обход продолжается и через неизменившиеся страницы
+    # Предрассчитанный полнотекстовый вектор: заголовок с весом 'A', текст с весом 'B'
+    search_vector = Column(TSVECTOR().with_variant(Text(), "sqlite"))
     
     doc_type = relationship("DocumentType")
     category = relationship("DocumentCategory")
     access_level = relationship("AccessLevel")
+    
+    __table_args__ = (
+        Index('ix_documents_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+
+class DocumentPassage(Base):
+    __tablename__ = 'document_passages'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+
+def make_passages(document_id, content):
+    """Фрагменты документа (предложения/абзацы) со смещениями в тексте"""
+    return [
+        DocumentPassage(
+            document_id=document_id,
+            position=position,
+            start_offset=start,
+            end_offset=end,
+            text=content[start:end]
+        )
+        for position, (start, end) in enumerate(split_passages(content))
+    ]
 
 class UserQuery(Base):
     __tablename__ = 'user_queries'
@@ -48,69 +90,311 @@ class UserQuery(Base):
     query_text = Column(Text, nullable=False)
     category_code = Column(String(10))
     response_text = Column(Text)
-    document_id = Column(Integer, ForeignKey('documents.id'))
+    document_id = Column(Integer, ForeignKey('documents.id', ondelete='SET NULL'))
     
     document = relationship("Document")
 
-def init_db():
-    engine = create_engine(Config.DB_URL)
+class CorpusVersion(Base):
+    __tablename__ = 'corpus_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    generation = Column(String(32))  # случайный идентификатор каждой версии: отличает разные базы с одним номером
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+def bump_corpus_version(session):
+    """Увеличение версии корпуса: сигнал для сброса кэшей поиска"""
+    state = session.get(CorpusVersion, 1)
+    if state is None:
+        session.add(CorpusVersion(id=1, version=1, generation=uuid.uuid4().hex))
+    else:
+        state.version += 1
+        state.generation = uuid.uuid4().hex
+
+def reset_tables(engine):
+    """Пересоздание всех таблиц. Номер версии корпуса переносится: после полной перезагрузки
+    он только растет, иначе работающие процессы не заметят смену данных"""
+    version = 0
+    with engine.connect() as connection:
+        try:
+            version = connection.execute(select(CorpusVersion.version).where(CorpusVersion.id == 1)).scalar() or 0
+        except SQLAlchemyError:
+            pass  # таблицы еще нет
     Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
-    
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Заполнение справочников 
-    categories = [
+    with engine.begin() as connection:
+        connection.execute(insert(CorpusVersion).values(id=1, version=version))
+
+def fts_config():
+    """Конфигурация полнотекстового поиска PostgreSQL"""
+    return cast(literal(Config.FTS_CONFIG), REGCONFIG)
+
+def search_vector_expression():
+    """Выражение для расчета search_vector из заголовка и текста документа"""
+    return func.setweight(
+        func.to_tsvector(fts_config(), func.coalesce(Document.title, '')), 'A'
+    ).op('||')(
+        func.setweight(func.to_tsvector(fts_config(), func.coalesce(Document.content, '')), 'B')
+    )
+
+def update_search_vectors(session, document_ids=None):
+    """Заполнение полнотекстовых векторов документов (всех или только указанных)"""
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    statement = update(Document).values(search_vector=search_vector_expression())
+    if document_ids is not None:
+        statement = statement.where(Document.id.in_(document_ids))
+    session.execute(statement, execution_options={"synchronize_session": False})
+
+REFERENCE_DATA = {
+    DocumentCategory: [
         {"code": "FIS", "name": "Финансовая поддержка", "description": "Запросы о финансовой поддержке"},
         {"code": "LAW", "name": "Законодательство", "description": "Запросы о нормативных актах"},
         {"code": "STA", "name": "Статистика", "description": "Запросы статистической информации"},
-    ]
-    
-    types = [
+    ],
+    DocumentType: [
         {"code": "03", "name": "Нормативные акты", "description": "Нормативно-правовые документы"},
         {"code": "12", "name": "Статистические отчеты", "description": "Официальная статистика"},
         {"code": "07", "name": "Методические рекомендации", "description": "Рекомендации и руководства"},
-    ]
-    
-    access_levels = [
+    ],
+    AccessLevel: [
         {"code": "A", "name": "Открытые данные", "description": "Общедоступная информация"},
         {"code": "D", "name": "Конфиденциальные", "description": "Доступ ограничен"},
-    ]
-    
-    for cat in categories:
-        session.add(DocumentCategory(**cat))
-    
-    for typ in types:
-        session.add(DocumentType(**typ))
+    ],
+}
+
+def seed_reference_data(session):
+    """Заполнение справочников (только отсутствующих записей)"""
+    for model, rows in REFERENCE_DATA.items():
+        existing = {code for (code,) in session.query(model.code)}
+        for row in rows:
+            if row["code"] not in existing:
+                session.add(model(**row))
+    session.flush()
+
+def load_reference_ids(session):
+    """Справочники в виде словарей код -> id"""
+    return {
+        model: {code: ref_id for ref_id, code in session.query(model.id, model.code)}
+        for model in REFERENCE_DATA
+    }
+
+def load_page_state():
+    """Состояние страниц прошлого обхода: url -> etag, last_modified, content_hash, links"""
+    engine = create_engine(Config.DB_URL)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    try:
+        rows = session.query(
+            Document.url, Document.etag, Document.last_modified, Document.content_hash, Document.outlinks
+        )
+        return {
+            url: {
+                "etag": etag,
+                "last_modified": last_modified,
+                "content_hash": content_hash,
+                "links": json.loads(outlinks) if outlinks else []
+            }
+            for url, etag, last_modified, content_hash, outlinks in rows
+        }
+    finally:
+        session.close()
+
+def default_scraped_path():
+    """Файл результатов обхода: потоковый NDJSON, если есть, иначе прежний JSON-массив"""
+    scraped_dir = Config.DATA_DIR / "scraped_data"
+    ndjson_path = scraped_dir / "scraped_data.ndjson"
+    return ndjson_path if ndjson_path.exists() else scraped_dir / "scraped_data.json"
+
+def default_delta_path():
+    """Файл изменений инкрементального обхода: отдельно от полного, который читает init_db"""
+    return Config.DATA_DIR / "scraped_data" / "scraped_delta.ndjson"
+
+def iter_scraped_records(scraped_path=None):
+    """Генератор записей обхода; NDJSON читается построчно, без загрузки файла целиком"""
+    scraped_path = Path(scraped_path or default_scraped_path())
+    if not scraped_path.exists():
+        return
+    with open(scraped_path, 'r', encoding='utf-8') as f:
+        if scraped_path.suffix == '.ndjson':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+def batched(records, size=None):
+    """Разбиение потока записей на пачки фиксированного размера"""
+    size = size or Config.DB_LOAD_BATCH_SIZE
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+def update_db(scraped_path=None):
+    """Инкрементальное обновление: только новые, измененные и исчезнувшие документы, без пересоздания таблиц"""
+    engine = create_engine(Config.DB_URL)
+    Base.metadata.create_all(engine)
     
-    for acc in access_levels:
-        session.add(AccessLevel(**acc))
+    Session = sessionmaker(bind=engine)
+    session = Session()
     
-    # Загрузка спарсенных данных
-    scraped_path = Config.DATA_DIR / "scraped_data" / "scraped_data.json"
-    if scraped_path.exists():
-        with open(scraped_path, 'r', encoding='utf-8') as f:
-            scraped_data = json.load(f)
+    try:
+        seed_reference_data(session)
+        refs = load_reference_ids(session)
+        touched_count = gone_count = 0
+        
+        for batch in batched(iter_scraped_records(scraped_path or default_delta_path())):
+            gone_urls = [record['url'] for record in batch if record.get('status') == 'gone']
+            changed = [record for record in batch if record.get('status') not in ('gone', 'unchanged')]
+            existing = dict(
+                session.query(Document.url, Document.id).filter(Document.url.in_([r['url'] for r in changed]))
+            ) if changed else {}
+            
+            if gone_urls:
+                session.execute(delete(Document).where(Document.url.in_(gone_urls)),
+                                execution_options={"synchronize_session": False})
+                gone_count += len(gone_urls)
             
-        for doc in scraped_data:
-            doc_type = session.query(DocumentType).filter_by(code=doc['type_code']).first()
-            category = session.query(DocumentCategory).filter_by(code=doc['category_code']).first()
-            access = session.query(AccessLevel).filter_by(code=doc['access_code']).first()
+            touched = []
+            for record in changed:
+                values = document_values(record, refs)
+                doc_id = existing.get(record['url'])
+                if doc_id is None:
+                    doc = Document(**values)
+                    session.add(doc)
+                    session.flush()
+                    doc_id = doc.id
+                    existing[record['url']] = doc_id
+                else:
+                    session.execute(update(Document).where(Document.id == doc_id).values(**values),
+                                    execution_options={"synchronize_session": False})
+                    session.execute(delete(DocumentPassage).where(DocumentPassage.document_id == doc_id))
+                session.add_all(make_passages(doc_id, record['content']))
+                touched.append(doc_id)
             
-            new_doc = Document(
-                title=doc['title'],
-                content=doc['content'],
-                url=doc['url'],
-                type_id=doc_type.id if doc_type else None,
-                category_id=category.id if category else None,
-                access_id=access.id if access else None
+            session.flush()
+            if touched:
+                update_search_vectors(session, touched)
+            touched_count += len(touched)
+            # Объекты пачки больше не нужны: память не растет с размером корпуса
+            session.expunge_all()
+        
+        if touched_count or gone_count:
+            bump_corpus_version(session)
+        session.commit()
+        print(f"Обновлено документов: {touched_count}, удалено: {gone_count}")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def copy_rows(session, table, columns, rows):
+    """Массовая вставка: COPY для PostgreSQL (psycopg2), executemany для остальных СУБД"""
+    if not rows:
+        return
+    connection = session.connection()
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
             )
-            session.add(new_doc)
+        finally:
+            cursor.close()
+    else:
+        session.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+def document_values(record, refs):
+    """Строка таблицы documents по записи обхода (справочники уже разрешены в словари)"""
+    return {
+        "title": record['title'],
+        "content": record['content'],
+        "url": record['url'],
+        "type_id": refs[DocumentType].get(record['type_code']),
+        "category_id": refs[DocumentCategory].get(record['category_code']),
+        "access_id": refs[AccessLevel].get(record['access_code']),
+        "etag": record.get('etag'),
+        "last_modified": record.get('last_modified'),
+        "content_hash": record.get('content_hash'),
+        "outlinks": json.dumps(record['links'], ensure_ascii=False) if record.get('links') is not None else None
+    }
+
+def load_documents(session, records, batch_size=None):
+    """Пакетная загрузка документов и фрагментов; возвращает статистику скорости"""
+    refs = load_reference_ids(session)
+    passage_columns = ["document_id", "position", "start_offset", "end_offset", "text"]
+    started = time.perf_counter()
+    documents = passages = duplicates = 0
+    loaded_urls = set()
+    
+    for batch in batched(records, batch_size):
+        batch = [record for record in batch if record.get('status') not in ('gone', 'unchanged')]
+        # Повторы URL (например, дописанные повторным обходом) пропускаются: url уникален
+        unique = []
+        for record in batch:
+            if record['url'] in loaded_urls:
+                duplicates += 1
+            else:
+                loaded_urls.add(record['url'])
+                unique.append(record)
+        batch = unique
+        if not batch:
+            continue
+        # Одна многострочная вставка на пачку, id возвращаются в порядке строк
+        ids = session.scalars(
+            insert(Document).returning(Document.id, sort_by_parameter_order=True),
+            [document_values(record, refs) for record in batch]
+        ).all()
+        
+        # Индекс фрагментов строится при загрузке, а не при каждом запросе
+        passage_rows = [
+            (doc_id, position, start, end, record['content'][start:end])
+            for doc_id, record in zip(ids, batch)
+            for position, (start, end) in enumerate(split_passages(record['content']))
+        ]
+        copy_rows(session, DocumentPassage.__table__, passage_columns, passage_rows)
+        documents += len(ids)
+        passages += len(passage_rows)
+    
+    elapsed = time.perf_counter() - started
+    return {
+        "documents": documents,
+        "passages": passages,
+        "duplicates": duplicates,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round((documents + passages) / elapsed, 1) if elapsed else 0.0
+    }
+
+def init_db(scraped_path=None):
+    engine = create_engine(Config.DB_URL)
+    reset_tables(engine)
+    
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    
+    # Заполнение справочников 
+    seed_reference_data(session)
+    
+    # Загрузка спарсенных данных пачками
+    stats = load_documents(session, iter_scraped_records(scraped_path))
     
+    update_search_vectors(session)
+    bump_corpus_version(session)
     session.commit()
     session.close()
-    print(f"База данных успешно инициализирована с {len(scraped_data) if scraped_path.exists() else 0} документами")
+    print(f"База данных успешно инициализирована с {stats['documents']} документами "
+          f"({stats['rows_per_second']} строк/с)")
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    import sys
+    if "--incremental" in sys.argv:
+        update_db()
+    else:
+        init_db()
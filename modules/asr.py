@@ -0,0 +1,222 @@
+from config import Config
+from typing import Dict, List
+import hashlib
+import json
+import threading
+import time
+import speech_recognition as sr
+
+
+class ASRBackend:
+    """Базовый класс движка распознавания речи"""
+
+    name = "base"
+
+    def __init__(self):
+        self.stats = {"calls": 0, "utterances": 0, "errors": 0, "total_ms": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def warm_up(self):
+        """Предварительная загрузка модели (по умолчанию не требуется)"""
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """Распознавание одного высказывания; при неудаче sr.UnknownValueError / sr.RequestError"""
+        started = time.perf_counter()
+        try:
+            text = self._transcribe(audio)
+        except Exception:
+            # Неудачный вызов учитывается только как ошибка, без влияния на среднее время
+            self._record(0, error=True)
+            raise
+        self._record(time.perf_counter() - started, utterances=1)
+        return text
+
+    def transcribe_batch(self, audios: List[sr.AudioData]) -> List[str]:
+        """Распознавание нескольких высказываний за один вызов; нераспознанные дают пустую строку"""
+        started = time.perf_counter()
+        try:
+            texts = self._transcribe_batch(audios)
+        except Exception:
+            self._record(0, error=True)
+            raise
+        self._record(time.perf_counter() - started, utterances=len(audios))
+        return texts
+
+    def _transcribe(self, audio: sr.AudioData) -> str:
+        raise NotImplementedError
+
+    def _transcribe_batch(self, audios: List[sr.AudioData]) -> List[str]:
+        results = []
+        for audio in audios:
+            try:
+                results.append(self._transcribe(audio))
+            except sr.UnknownValueError:
+                results.append("")
+        return results
+
+    def _record(self, elapsed: float, utterances: int = 0, error: bool = False):
+        with self._stats_lock:
+            if error:
+                self.stats["errors"] += 1
+                return
+            self.stats["calls"] += 1
+            self.stats["utterances"] += utterances
+            self.stats["total_ms"] += elapsed * 1000
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats, backend=self.name)
+        stats["avg_ms_per_utterance"] = stats["total_ms"] / stats["utterances"] if stats["utterances"] else 0.0
+        return stats
+
+
+class GoogleASRBackend(ASRBackend):
+    """Удаленный сервис Google Web Speech"""
+
+    name = "google"
+
+    def __init__(self, language: str = Config.ASR_LANGUAGE):
+        super().__init__()
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def _transcribe(self, audio: sr.AudioData) -> str:
+        return self.recognizer.recognize_google(audio, language=self.language)
+
+
+class VoskASRBackend(ASRBackend):
+    """Локальное офлайн-распознавание Vosk; модель загружается один раз на процесс"""
+
+    name = "vosk"
+    _models = {}
+    _models_lock = threading.Lock()
+
+    def __init__(self, model_path: str = Config.VOSK_MODEL_PATH):
+        super().__init__()
+        self.model_path = model_path
+
+    @property
+    def model(self):
+        model = self._models.get(self.model_path)
+        if model is None:
+            with self._models_lock:
+                model = self._models.get(self.model_path)
+                if model is None:
+                    from vosk import Model, SetLogLevel
+                    SetLogLevel(-1)
+                    model = Model(self.model_path)
+                    self._models[self.model_path] = model
+        return model
+
+    def warm_up(self):
+        return self.model
+
+    def _recognizer(self, sample_rate: int):
+        from vosk import KaldiRecognizer
+        return KaldiRecognizer(self.model, sample_rate)
+
+    def _decode(self, recognizer, audio: sr.AudioData) -> str:
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_width=2))
+        # FinalResult сбрасывает распознаватель, поэтому его можно использовать повторно
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+    def _transcribe(self, audio: sr.AudioData) -> str:
+        text = self._decode(self._recognizer(audio.sample_rate), audio)
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def _transcribe_batch(self, audios: List[sr.AudioData]) -> List[str]:
+        recognizers = {}
+        results = []
+        for audio in audios:
+            recognizer = recognizers.get(audio.sample_rate)
+            if recognizer is None:
+                recognizer = recognizers[audio.sample_rate] = self._recognizer(audio.sample_rate)
+            results.append(self._decode(recognizer, audio))
+        return results
+
+
+class StubASRBackend(ASRBackend):
+    """Детерминированная заглушка для тестов и нагрузочных прогонов"""
+
+    name = "stub"
+
+    def __init__(self, responses: Dict[str, str] = None, default_text: str = Config.ASR_STUB_TEXT,
+                 latency: float = 0.0):
+        super().__init__()
+        self.responses = responses or {}  # sha1 сырых данных -> текст
+        self.default_text = default_text
+        self.latency = latency
+
+    @staticmethod
+    def fingerprint(audio: sr.AudioData) -> str:
+        return hashlib.sha1(audio.frame_data).hexdigest()
+
+    def _transcribe(self, audio: sr.AudioData) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if not audio.frame_data:
+            raise sr.UnknownValueError()
+        return self.responses.get(self.fingerprint(audio), self.default_text)
+
+    def _transcribe_batch(self, audios: List[sr.AudioData]) -> List[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [
+            self.responses.get(self.fingerprint(audio), self.default_text) if audio.frame_data else ""
+            for audio in audios
+        ]
+
+
+ASR_BACKENDS = {
+    GoogleASRBackend.name: GoogleASRBackend,
+    VoskASRBackend.name: VoskASRBackend,
+    StubASRBackend.name: StubASRBackend,
+}
+
+
+def create_asr_backend(name: str = None) -> ASRBackend:
+    name = name or Config.ASR_BACKEND
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"Неизвестный движок распознавания: {name}")
+    return ASR_BACKENDS[name]()
+
+
+def compare_backends(audios: List[sr.AudioData], names: List[str]) -> List[Dict]:
+    """Замер задержки движков на одном наборе записей"""
+    report = []
+    for name in names:
+        backend = create_asr_backend(name)
+        try:
+            backend.warm_up()
+        except Exception as e:
+            # Движок без установленного пакета или модели не прерывает сравнение остальных
+            report.append({"backend": name, "unavailable": f"{type(e).__name__}: {e}"})
+            continue
+        for audio in audios:
+            try:
+                backend.transcribe(audio)
+            except (sr.UnknownValueError, sr.RequestError):
+                pass
+        try:
+            backend.transcribe_batch(audios)
+        except (sr.UnknownValueError, sr.RequestError):
+            pass  # ошибка уже учтена в статистике движка
+        report.append(backend.get_stats())
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+
+    files = sys.argv[1:]
+    audios = []
+    for path in files:
+        with sr.AudioFile(path) as source:
+            audios.append(sr.Recognizer().record(source))
+    for stats in compare_backends(audios, list(ASR_BACKENDS)):
+        if "unavailable" in stats:
+            print(f"{stats['backend']}: недоступен ({stats['unavailable']})")
+            continue
+        print(f"{stats['backend']}: {stats['avg_ms_per_utterance']:.1f} мс на высказывание, ошибок {stats['errors']}")
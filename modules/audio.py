@@ -0,0 +1,44 @@
+from config import Config
+import subprocess
+import speech_recognition as sr
+
+
+class AudioDecodeError(Exception):
+    """Ошибка декодирования аудио"""
+
+
+class AudioConverter:
+    """Декодирование аудио в памяти: webm/opus -> PCM 16 бит, моно, 16 кГц"""
+
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2  # байт на отсчет (s16le)
+
+    @staticmethod
+    def decode_to_pcm(data: bytes, sample_rate: int = SAMPLE_RATE,
+                      max_seconds: float = Config.MAX_AUDIO_SECONDS) -> bytes:
+        """Декодирование, сведение в моно и передискретизация одним вызовом ffmpeg через каналы"""
+        command = [
+            Config.FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-nostdin",
+            "-i", "pipe:0",
+            "-t", str(max_seconds),  # Ограничение длительности ограничивает и объем PCM
+            "-ac", "1", "-ar", str(sample_rate),
+            "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"
+        ]
+        try:
+            result = subprocess.run(command, input=data, capture_output=True,
+                                    timeout=Config.AUDIO_DECODE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AudioDecodeError(str(e)) from e
+
+        if result.returncode != 0 or not result.stdout:
+            raise AudioDecodeError(result.stderr.decode("utf-8", "replace").strip() or "пустой аудиопоток")
+        return result.stdout
+
+    @staticmethod
+    def to_audio_data(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> sr.AudioData:
+        """Передача сырых отсчетов распознавателю без промежуточного WAV"""
+        return sr.AudioData(pcm, sample_rate, AudioConverter.SAMPLE_WIDTH)
+
+    @staticmethod
+    def decode(data: bytes) -> sr.AudioData:
+        return AudioConverter.to_audio_data(AudioConverter.decode_to_pcm(data))
@@ -1,63 +1,620 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from data.db_init import Document, DocumentCategory, DocumentType, AccessLevel, UserQuery
+from sqlalchemy import create_engine, or_, func, insert, select, text, values, column, true, literal, union_all, Integer, String
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, joinedload
+from data.db_init import Document, DocumentCategory, DocumentType, AccessLevel, UserQuery, CorpusVersion, DocumentPassage, fts_config
+from modules.search_index import SearchIndex
+from modules.index_snapshot import snapshot_path, save_snapshot, load_snapshot, remove_stale_snapshots, build_lock
+from modules.passages import best_passage
+from modules.query_log import QueryLogWriter
+from modules.query_cache import QueryCache
+from modules.metrics import ROWS_SCANNED
 from config import Config
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from collections import defaultdict
+import asyncio
+import re
+import threading
+import time
+
+CORPUS_VERSION_QUERY = select(CorpusVersion.version, CorpusVersion.generation).where(CorpusVersion.id == 1)
+
+
+def engine_options(url: str) -> Dict:
+    """Параметры пула соединений из Config (у SQLite собственный пул)"""
+    options = {"pool_pre_ping": Config.DB_POOL_PRE_PING, "query_cache_size": Config.DB_STATEMENT_CACHE_SIZE}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_recycle=Config.DB_POOL_RECYCLE
+        )
+    return options
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.engine = create_engine(Config.DB_URL)
+    def __init__(self, nlp=None):
+        self.nlp = nlp
+        self.engine = create_engine(Config.DB_URL, **engine_options(Config.DB_URL))
         self.Session = sessionmaker(bind=self.engine)
+        
+        # Асинхронный режим (asyncpg): поиск в БД без занятия потоков пула
+        self.async_engine = None
+        self.AsyncSession = None
+        if Config.DB_ASYNC:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            url = make_url(Config.DB_ASYNC_URL).update_query_dict(
+                {"prepared_statement_cache_size": str(Config.DB_STATEMENT_CACHE_SIZE)}
+            )
+            self.async_engine = create_async_engine(url, **engine_options(Config.DB_ASYNC_URL))
+            self.AsyncSession = async_sessionmaker(self.async_engine, expire_on_commit=False)
+        
+        self.index = None
+        self.ranker = None
+        self.fuzzy = None
+        self.log_writer = None
+        self.cache = QueryCache()
+        
+        self.corpus_version = None  # (номер, поколение)
+        self._version_checked_at = 0.0
+        self._rebuild_lock = threading.Lock()
+        self._rebuilding = False
+    
+    def warm_up(self):
+        """Открытие соединения пула и проверка доступности БД"""
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    
+    async def warm_up_async(self):
+        if self.async_engine is not None:
+            async with self.async_engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+    
+    async def dispose_async(self):
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+    
+    @staticmethod
+    def _version_key(row) -> Tuple[int, Optional[str]]:
+        return (row.version, row.generation) if row is not None else (0, None)
+    
+    def get_corpus_version(self) -> Tuple[int, Optional[str]]:
+        """Номер и поколение корпуса: поколение различает базы с одинаковым номером версии"""
+        session = self.Session()
+        
+        try:
+            return self._version_key(session.execute(CORPUS_VERSION_QUERY).first())
+        finally:
+            session.close()
+    
+    def _version_check_due(self, force: bool) -> bool:
+        now = time.monotonic()
+        if not force and now - self._version_checked_at < Config.CORPUS_VERSION_CHECK_INTERVAL:
+            return False
+        self._version_checked_at = now
+        return True
+    
+    def check_corpus_version(self, force: bool = False) -> bool:
+        """Проверка версии корпуса не чаще CORPUS_VERSION_CHECK_INTERVAL; при изменении сбрасывает кэш"""
+        if not self._version_check_due(force):
+            return False
+        return self._set_corpus_version(self.get_corpus_version())
+    
+    async def check_corpus_version_async(self) -> bool:
+        if not self._version_check_due(False):
+            return False
+        async with self.AsyncSession() as session:
+            version = self._version_key((await session.execute(CORPUS_VERSION_QUERY)).first())
+        if version == self.corpus_version:
+            return False
+        return await asyncio.to_thread(self._set_corpus_version, version)
+    
+    def _set_corpus_version(self, version: Tuple[int, Optional[str]]) -> bool:
+        if version == self.corpus_version:
+            return False
+        
+        changed = self.corpus_version is not None
+        self.corpus_version = version
+        if changed:
+            self.cache.clear()
+            if (self.index is not None or self.ranker is not None) and self.nlp is not None:
+                self._start_rebuild()
+        return changed
+    
+    def _start_rebuild(self):
+        """Перестроение индексов в фоновом потоке: запрос, заметивший новую версию,
+        не ждет построения, до его окончания отвечает прежний индекс"""
+        with self._rebuild_lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name="search-index-rebuild", daemon=True).start()
+    
+    def _rebuild(self):
+        try:
+            while True:
+                version = self.corpus_version
+                if self.index is not None:
+                    self.build_search_index()
+                if self.ranker is not None:
+                    self.build_ranker()
+                # Результаты, закэшированные по старому индексу во время построения, сбрасываются
+                self.cache.clear()
+                with self._rebuild_lock:
+                    if version == self.corpus_version:
+                        self._rebuilding = False
+                        return
+        except Exception as e:
+            print(f"Ошибка перестроения поискового индекса: {e}")
+            with self._rebuild_lock:
+                self._rebuilding = False
+    
+    def build_search_index(self, nlp=None) -> SearchIndex:
+        """Поисковый индекс текущей версии корпуса: снимок на диске отображается в память
+        и разделяется воркерами; если снимка еще нет, он строится и сохраняется"""
+        self.nlp = nlp or self.nlp
+        nlp = self.nlp.load()
+        # Версия запоминается до построения: изменение корпуса во время построения будет замечено
+        if self.corpus_version is None:
+            self.corpus_version = self.get_corpus_version()
+        if not Config.INDEX_SNAPSHOT_DIR:
+            self.index = self._build_index(nlp)
+        else:
+            version, generation = self.corpus_version
+            path = snapshot_path(Config.INDEX_SNAPSHOT_DIR, version, generation)
+            try:
+                if not path.exists():
+                    # Снимок строит один воркер, остальные дожидаются готового файла
+                    with build_lock(path):
+                        if not path.exists():
+                            save_snapshot(self._build_index(nlp), path, version, generation)
+                            remove_stale_snapshots(Config.INDEX_SNAPSHOT_DIR, path)
+                # Замена ссылки атомарна: текущие запросы дорабатывают со старым индексом
+                self.index = load_snapshot(path, nlp.stem, version, generation)
+            except (OSError, ValueError) as e:
+                print(f"Снимок индекса недоступен ({e}), индекс строится в памяти")
+                self.index = self._build_index(nlp)
+        self.build_fuzzy_index(self.index.terms())
+        return self.index
+    
+    def _build_index(self, nlp) -> SearchIndex:
+        """Построение инвертированного индекса по фрагментам документов (без загрузки полных текстов)"""
+        session = self.Session()
+        
+        try:
+            passages = defaultdict(list)
+            passage_rows = (
+                session.query(
+                    DocumentPassage.document_id, DocumentPassage.id, DocumentPassage.text,
+                    DocumentPassage.start_offset, DocumentPassage.end_offset
+                )
+                .order_by(DocumentPassage.document_id, DocumentPassage.position)
+                .yield_per(1000)
+            )
+            for document_id, passage_id, text, start, end in passage_rows:
+                passages[document_id].append({"id": passage_id, "text": text, "start": start, "end": end})
+            
+            rows = (
+                session.query(
+                    Document.id, Document.title, Document.url,
+                    Document.access_id, DocumentCategory.code, DocumentType.code
+                )
+                .outerjoin(DocumentCategory, Document.category_id == DocumentCategory.id)
+                .outerjoin(DocumentType, Document.type_id == DocumentType.id)
+                .order_by(Document.id)
+                .yield_per(500)
+            )
+            documents = (
+                {
+                    "id": doc_id,
+                    "title": title,
+                    "url": url,
+                    "access_id": access_id,
+                    "category": category,
+                    "doc_type": doc_type,
+                    "passages": passages.pop(doc_id, [])
+                }
+                for doc_id, title, url, access_id, category, doc_type in rows
+            )
+            return SearchIndex.build(documents, nlp.preprocess_text, nlp.stem)
+        finally:
+            session.close()
+    
+    def build_ranker(self, nlp=None):
+        """Матрица TF-IDF по заголовкам и полным текстам документов (SEARCH_BACKEND=tfidf)"""
+        from modules.tfidf_ranker import TfidfRanker
+        
+        self.nlp = nlp or self.nlp
+        nlp = self.nlp.load()
+        if self.corpus_version is None:
+            self.corpus_version = self.get_corpus_version()
+        session = self.Session()
+        try:
+            rows = (
+                session.query(
+                    Document.id, Document.title, Document.content, Document.url,
+                    Document.access_id, DocumentCategory.code, DocumentType.code
+                )
+                .outerjoin(DocumentCategory, Document.category_id == DocumentCategory.id)
+                .outerjoin(DocumentType, Document.type_id == DocumentType.id)
+                .order_by(Document.id)
+                .yield_per(500)
+            )
+            documents = (
+                (
+                    {
+                        "id": doc_id,
+                        "title": title,
+                        "url": url,
+                        "access_id": access_id,
+                        "category": category,
+                        "doc_type": doc_type
+                    },
+                    nlp.preprocess_text(title) * Config.TITLE_WEIGHT + nlp.preprocess_text(content)
+                )
+                for doc_id, title, content, url, access_id, category, doc_type in rows
+            )
+            # Замена ссылки атомарна: текущие запросы дорабатывают со старой матрицей
+            self.ranker = TfidfRanker.build(documents)
+            self.build_fuzzy_index(self.ranker.vocabulary)
+            return self.ranker
+        finally:
+            session.close()
+    
+    def build_fuzzy_index(self, terms):
+        """Индекс триграмм по словарю активного поискового движка (FUZZY_MATCHING)"""
+        if Config.FUZZY_MATCHING:
+            from modules.fuzzy_terms import TrigramIndex
+            self.fuzzy = TrigramIndex(terms)
+        return self.fuzzy
+    
+    def correct_tokens(self, query_tokens: List[str]) -> List[str]:
+        """Основы слов вне словаря заменяются ближайшими терминами индекса"""
+        if self.fuzzy is None:
+            return query_tokens
+        return self.fuzzy.correct(query_tokens)
     
     def search_documents(self, query_tokens, category_code=None, doc_type_code=None):
+        """Поиск документов с кэшированием результатов по нормализованному запросу"""
+        self.check_corpus_version()
+        
+        query_tokens = self.correct_tokens(query_tokens)
+        key = QueryCache.make_key(query_tokens, category_code, doc_type_code)
+        results = self.cache.get(key)
+        if results is None:
+            results = self._search_documents(query_tokens, category_code, doc_type_code)
+            self.cache.put(key, results)
+        return list(results)
+    
+    def _search_documents(self, query_tokens, category_code=None, doc_type_code=None):
+        if self.index is not None and Config.SEARCH_BACKEND == "index":
+            return self.index.search(query_tokens, category_code, doc_type_code)
+        if self.ranker is not None and Config.SEARCH_BACKEND == "tfidf":
+            results = self.ranker.search(query_tokens, category_code, doc_type_code)
+        elif Config.SEARCH_BACKEND == "fts":
+            results = self.search_documents_fts(query_tokens, category_code, doc_type_code)
+        else:
+            results = self.search_documents_ilike(query_tokens, category_code, doc_type_code)
+        return self.attach_passages(results, query_tokens)
+    
+    def search_batch(self, requests: List[Tuple[List[str], Optional[str], Optional[str]]]) -> List[List[Dict]]:
+        """Поиск пачки запросов (tokens, category, doc_type): запросы с общими фильтрами
+        выполняются одним проходом индекса или одним запросом к БД"""
+        self.check_corpus_version()
+        
+        results = [None] * len(requests)
+        token_lists = [self.correct_tokens(query_tokens) for query_tokens, _, _ in requests]
+        groups = defaultdict(dict)  # (category, doc_type) -> ключ кэша -> позиции запросов
+        for position, (_, category_code, doc_type_code) in enumerate(requests):
+            key = QueryCache.make_key(token_lists[position], category_code, doc_type_code)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[position] = list(cached)
+            else:
+                groups[(category_code, doc_type_code)].setdefault(key, []).append(position)
+        
+        for (category_code, doc_type_code), keys in groups.items():
+            group_tokens = [token_lists[positions[0]] for positions in keys.values()]
+            for (key, positions), group_results in zip(
+                    keys.items(), self._search_group(group_tokens, category_code, doc_type_code)):
+                self.cache.put(key, group_results)
+                for position in positions:
+                    results[position] = list(group_results)
+        return results
+    
+    def _search_group(self, token_lists, category_code=None, doc_type_code=None) -> List[List[Dict]]:
+        if self.index is not None and Config.SEARCH_BACKEND == "index":
+            return self.index.search_batch(token_lists, category_code, doc_type_code)
+        if self.ranker is not None and Config.SEARCH_BACKEND == "tfidf":
+            result_lists = self.ranker.search_batch(token_lists, category_code, doc_type_code)
+        elif Config.SEARCH_BACKEND == "fts":
+            result_lists = self.search_documents_fts_batch(token_lists, category_code, doc_type_code)
+        else:
+            result_lists = self.search_documents_ilike_batch(token_lists, category_code, doc_type_code)
+        return self.attach_passages_batch(result_lists, token_lists)
+    
+    @property
+    def async_search(self) -> bool:
+        """Поиск выполняется асинхронно, если нужен запрос к БД (индекс или матрица TF-IDF в памяти не используются)"""
+        in_memory = (
+            (self.index is not None and Config.SEARCH_BACKEND == "index")
+            or (self.ranker is not None and Config.SEARCH_BACKEND == "tfidf")
+        )
+        return self.async_engine is not None and not in_memory
+    
+    async def search_documents_async(self, query_tokens, category_code=None, doc_type_code=None):
+        """Асинхронный поиск (DB_ASYNC): ожидание БД не занимает потоки и не блокирует цикл событий"""
+        await self.check_corpus_version_async()
+        
+        query_tokens = self.correct_tokens(query_tokens)
+        key = QueryCache.make_key(query_tokens, category_code, doc_type_code)
+        results = self.cache.get(key)
+        if results is None:
+            results = await self._search_documents_async(query_tokens, category_code, doc_type_code)
+            self.cache.put(key, results)
+        return list(results)
+    
+    async def _search_documents_async(self, query_tokens, category_code=None, doc_type_code=None):
+        async with self.AsyncSession() as session:
+            if Config.SEARCH_BACKEND == "fts":
+                terms = self._fts_terms(query_tokens)
+                if not terms:
+                    return []
+                rows = (await session.execute(self._fts_statement(terms, category_code, doc_type_code))).all()
+                results = self._fts_results(rows)
+            else:
+                statement = self._ilike_statement(query_tokens, category_code, doc_type_code)
+                if statement is None:
+                    return []
+                results = self._ilike_results((await session.execute(statement)).all())
+            if not results:
+                return results
+            passage_rows = (await session.execute(self._passages_statement({result["id"] for result in results}))).all()
+        return self._with_passages(results, self._group_passages(passage_rows), query_tokens)
+    
+    @staticmethod
+    def _passages_statement(document_ids):
+        return (
+            select(
+                DocumentPassage.document_id, DocumentPassage.id, DocumentPassage.text,
+                DocumentPassage.start_offset, DocumentPassage.end_offset
+            )
+            .where(DocumentPassage.document_id.in_(document_ids))
+            .order_by(DocumentPassage.document_id, DocumentPassage.position)
+        )
+    
+    @staticmethod
+    def _group_passages(rows) -> Dict[int, List[Dict]]:
+        passages = defaultdict(list)
+        for document_id, passage_id, passage_text, start, end in rows:
+            passages[document_id].append({"id": passage_id, "text": passage_text, "start": start, "end": end})
+        return passages
+    
+    def _with_passages(self, results: List[Dict], passages: Dict[int, List[Dict]], query_tokens) -> List[Dict]:
+        stem = self.nlp.stem if self.nlp is not None else (lambda word: word)
+        for result in results:
+            result.pop("content", None)
+            result["passage"] = best_passage(passages.get(result["id"], []), query_tokens, stem)
+        return results
+    
+    def attach_passages(self, results: List[Dict], query_tokens) -> List[Dict]:
+        """Замена полного текста найденных документов лучшими фрагментами"""
+        return self.attach_passages_batch([results], [query_tokens])[0]
+    
+    def attach_passages_batch(self, result_lists: List[List[Dict]], token_lists) -> List[List[Dict]]:
+        """Фрагменты для результатов нескольких запросов одним запросом к БД"""
+        document_ids = {result["id"] for results in result_lists for result in results}
+        if not document_ids:
+            return result_lists
+        session = self.Session()
+        
+        try:
+            passages = self._group_passages(session.execute(self._passages_statement(document_ids)).all())
+        finally:
+            session.close()
+        return [
+            self._with_passages(results, passages, query_tokens)
+            for results, query_tokens in zip(result_lists, token_lists)
+        ]
+    
+    @staticmethod
+    def _filter_codes(statement, category_code=None, doc_type_code=None):
+        if category_code:
+            statement = statement.join(DocumentCategory).where(DocumentCategory.code == category_code)
+        if doc_type_code:
+            statement = statement.join(DocumentType).where(DocumentType.code == doc_type_code)
+        return statement
+    
+    @staticmethod
+    def _occurrences(column, token: str):
+        """Число вхождений подстроки в столбец, вычисляемое в БД"""
+        lowered = func.lower(column)
+        return (func.length(lowered) - func.length(func.replace(lowered, token, ""))) / len(token)
+    
+    def _ilike_statement(self, query_tokens, category_code=None, doc_type_code=None, limit: int = Config.SEARCH_LIMIT):
+        """Поиск подстрок с ранжированием в БД: текст документов не передается в приложение"""
+        tokens = [token for token in query_tokens if token]
+        if not tokens:
+            return None
+        
+        # Ранжирование: содержание с весом 3, заголовок с максимальным весом 5
+        score = sum(
+            self._occurrences(Document.content, token) * 3 + self._occurrences(Document.title, token) * 5
+            for token in tokens
+        ).label("score")
+        # Улучшенный поиск по токенам: документ подходит, если содержит хотя бы один токен
+        conditions = []
+        for token in tokens:
+            conditions.append(Document.content.ilike(f"%{token}%"))
+            conditions.append(Document.title.ilike(f"%{token}%"))
+        
+        statement = (
+            select(Document.id, Document.title, Document.url, score, func.count().over().label("matched"))
+            .where(Document.access_id == 1, or_(*conditions))
+        )
+        statement = self._filter_codes(statement, category_code, doc_type_code)
+        return statement.order_by(score.desc(), Document.id).limit(limit)
+    
+    @staticmethod
+    def _ilike_results(rows) -> List[Dict]:
+        ROWS_SCANNED.inc(rows[0].matched if rows else 0, backend="ilike")
+        return [
+            {"id": row.id, "title": row.title, "url": row.url, "score": int(row.score)}
+            for row in rows
+            if row.score > 0
+        ]
+    
+    def search_documents_ilike(self, query_tokens, category_code=None, doc_type_code=None):
+        """Поиск подстрок ILIKE с ранжированием на стороне БД"""
+        statement = self._ilike_statement(query_tokens, category_code, doc_type_code)
+        if statement is None:
+            return []
+        session = self.Session()
+        try:
+            return self._ilike_results(session.execute(statement).all())
+        finally:
+            session.close()
+    
+    def search_documents_ilike_batch(self, token_lists, category_code=None, doc_type_code=None) -> List[List[Dict]]:
+        """Поиск подстрок для пачки запросов: подзапросы с LIMIT объединяются через UNION ALL,
+        одно обращение к БД на ILIKE_BATCH_SIZE запросов (VALUES и LATERAL недоступны в SQLite)"""
+        statements = []
+        for position, query_tokens in enumerate(token_lists):
+            statement = self._ilike_statement(query_tokens, category_code, doc_type_code)
+            if statement is not None:
+                matches = statement.subquery()
+                statements.append(select(literal(position).label("position"), matches))
+        
+        grouped = defaultdict(list)
+        session = self.Session()
+        try:
+            for start in range(0, len(statements), Config.ILIKE_BATCH_SIZE):
+                chunk = statements[start:start + Config.ILIKE_BATCH_SIZE]
+                statement = chunk[0] if len(chunk) == 1 else union_all(*chunk)
+                for row in session.execute(statement).all():
+                    grouped[row.position].append(row)
+        finally:
+            session.close()
+        
+        # UNION ALL не сохраняет порядок подзапросов: сортировка внутри каждого запроса
+        return [
+            self._ilike_results(sorted(grouped[position], key=lambda row: (-row.score, row.id)))
+            if position in grouped else []
+            for position in range(len(token_lists))
+        ]
+    
+    @staticmethod
+    def _fts_terms(query_tokens) -> List[str]:
+        return [token for token in query_tokens if re.fullmatch(r"\w+", token)]
+    
+    def _fts_statement(self, terms, category_code=None, doc_type_code=None):
+        # Префиксное совпадение по основам, как и в поиске по подстроке
+        ts_query = func.to_tsquery(fts_config(), " | ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank_cd(Document.search_vector, ts_query)
+        statement = (
+            select(Document.id, Document.title, Document.url, rank.label("score"))
+            .where(Document.access_id == 1)
+            .where(Document.search_vector.bool_op("@@")(ts_query))
+        )
+        statement = self._filter_codes(statement, category_code, doc_type_code)
+        return statement.order_by(rank.desc()).limit(Config.SEARCH_LIMIT)
+    
+    @staticmethod
+    def _fts_results(rows) -> List[Dict]:
+        ROWS_SCANNED.inc(len(rows), backend="fts")
+        return [
+            {
+                "id": row.id,
+                "title": row.title,
+                "url": row.url,
+                "score": row.score
+            }
+            for row in rows
+        ]
+    
+    def search_documents_fts_batch(self, token_lists, category_code=None, doc_type_code=None) -> List[List[Dict]]:
+        """Полнотекстовый поиск пачки запросов за один запрос: VALUES с tsquery и LATERAL-подзапрос с LIMIT"""
+        queries = [
+            (position, " | ".join(f"{term}:*" for term in terms))
+            for position, terms in enumerate(map(self._fts_terms, token_lists))
+            if terms
+        ]
+        result_lists = [[] for _ in token_lists]
+        if not queries:
+            return result_lists
+        
+        query_values = values(column("position", Integer), column("ts_query", String), name="q").data(queries)
+        ts_query = func.to_tsquery(fts_config(), query_values.c.ts_query)
+        rank = func.ts_rank_cd(Document.search_vector, ts_query)
+        matches = (
+            select(Document.id, Document.title, Document.url, rank.label("score"))
+            .where(Document.access_id == 1)
+            .where(Document.search_vector.bool_op("@@")(ts_query))
+        )
+        matches = self._filter_codes(matches, category_code, doc_type_code)
+        matches = matches.order_by(rank.desc()).limit(Config.SEARCH_LIMIT).lateral("matches")
+        statement = (
+            select(query_values.c.position, matches.c.id, matches.c.title, matches.c.url, matches.c.score)
+            .select_from(query_values)
+            .join(matches, true())
+            .order_by(query_values.c.position, matches.c.score.desc())
+        )
+        
+        session = self.Session()
+        try:
+            rows = session.execute(statement).all()
+        finally:
+            session.close()
+        
+        ROWS_SCANNED.inc(len(rows), backend="fts")
+        for row in rows:
+            result_lists[row.position].append({"id": row.id, "title": row.title, "url": row.url, "score": row.score})
+        return result_lists
+    
+    def search_documents_fts(self, query_tokens, category_code=None, doc_type_code=None):
+        """Полнотекстовый поиск PostgreSQL: отбор, ранжирование и LIMIT на стороне БД"""
+        terms = self._fts_terms(query_tokens)
+        if not terms:
+            return []
+        
         session = self.Session()
         try:
-            query = session.query(Document).filter(Document.access_id == 1)
-            if category_code:
-                query = query.join(DocumentCategory).filter(DocumentCategory.code == category_code)
-            if doc_type_code:
-                query = query.join(DocumentType).filter(DocumentType.code == doc_type_code)
-            # Улучшенный поиск по токенам
-            conditions = []
-            for token in query_tokens:
-                conditions.append(Document.content.ilike(f"%{token}%"))
-                conditions.append(Document.title.ilike(f"%{token}%"))
-                if conditions:
-                    query = query.filter(or_(*conditions))
-            # Ранжирование результатов
-            documents = query.all()
-            scored_docs = []
-            for doc in documents:
-                score = 0
-                content = doc.content.lower()
-                title = doc.title.lower()
-                for token in query_tokens:
-                    score += content.count(token) * 3  # Больший вес содержанию
-                    score += title.count(token) * 5    # Максимальный вес заголовку
-                    if score > 0:
-                        scored_docs.append({
-                            "id": doc.id,
-                            "title": doc.title,
-                            "content": doc.content,
-                            "url": doc.url,
-                            "score": score
-                            })
-                        
-            return sorted(scored_docs, key=lambda x: x["score"], reverse=True)[:5]  # Топ-5 результатов
+            rows = session.execute(self._fts_statement(terms, category_code, doc_type_code)).all()
+            return self._fts_results(rows)
         finally:
             session.close()
     
+    def start_log_writer(self) -> QueryLogWriter:
+        """Запуск фоновой пакетной записи журнала запросов"""
+        if self.log_writer is None:
+            self.log_writer = QueryLogWriter(self.log_queries)
+        self.log_writer.start()
+        return self.log_writer
+    
+    def stop_log_writer(self):
+        if self.log_writer is not None:
+            self.log_writer.stop()
+    
     def log_query(self, query_text: str, category_code: str, response_text: str, document_id: int = None):
+        record = {
+            "query_text": query_text,
+            "category_code": category_code,
+            "response_text": response_text,
+            "document_id": document_id
+        }
+        if self.log_writer is not None:
+            self.log_writer.submit(record)
+        else:
+            self.log_queries([record])
+    
+    def log_queries(self, records: List[Dict]):
+        """Запись пачки запросов одной многострочной вставкой в одной транзакции"""
+        if not records:
+            return
         session = self.Session()
         
         try:
-            new_query = UserQuery(
-                query_text=query_text,
-                category_code=category_code,
-                response_text=response_text,
-                document_id=document_id
-            )
-            session.add(new_query)
+            session.execute(insert(UserQuery), records)
             session.commit()
         except Exception as e:
             session.rollback()
@@ -65,21 +622,41 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @staticmethod
+    def _document_statement(doc_id: int):
+        # Категория, тип и уровень доступа загружаются тем же запросом (без N+1)
+        return (
+            select(Document)
+            .options(
+                joinedload(Document.category),
+                joinedload(Document.doc_type),
+                joinedload(Document.access_level)
+            )
+            .where(Document.id == doc_id)
+        )
+    
+    @staticmethod
+    def _document_dict(doc: Document) -> Dict:
+        return {
+            "id": doc.id,
+            "title": doc.title,
+            "content": doc.content,
+            "url": doc.url,
+            "category": doc.category.code if doc.category else None,
+            "type": doc.doc_type.code if doc.doc_type else None,
+            "access": doc.access_level.code if doc.access_level else None
+        }
+    
     def get_document_by_id(self, doc_id: int) -> Optional[Dict]:
         session = self.Session()
         
         try:
-            doc = session.query(Document).filter(Document.id == doc_id).first()
-            if doc:
-                return {
-                    "id": doc.id,
-                    "title": doc.title,
-                    "content": doc.content,
-                    "url": doc.url,
-                    "category": doc.category.code,
-                    "type": doc.doc_type.code,
-                    "access": doc.access_level.code
-                }
-            return None
+            doc = session.execute(self._document_statement(doc_id)).scalars().first()
+            return self._document_dict(doc) if doc else None
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+    
+    async def get_document_by_id_async(self, doc_id: int) -> Optional[Dict]:
+        async with self.AsyncSession() as session:
+            doc = (await session.execute(self._document_statement(doc_id))).scalars().first()
+            return self._document_dict(doc) if doc else None
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config import Config
+from typing import Dict
+import asyncio
+import functools
+import threading
+
+
+class StageOverloaded(Exception):
+    """Очередь этапа заполнена: запрос следует отклонить (503)"""
+
+    def __init__(self, stage: str, retry_after: int = 1):
+        super().__init__(f"Этап '{stage}' перегружен")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageTimeout(Exception):
+    """Этап не уложился в отведенное время"""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Этап '{stage}' превысил таймаут {timeout} с")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class _Stage:
+    def __init__(self, name: str, kind: str, workers: int, max_pending: int, timeout: float):
+        self.name = name
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.stats = {"submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0}
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            pool_class = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            options = {} if self.kind == "process" else {"thread_name_prefix": f"stage-{self.name}"}
+            self.pool = pool_class(max_workers=self.workers, **options)
+        return self.pool
+
+    def release(self, _future=None):
+        with self.lock:
+            self.pending -= 1
+            self.stats["completed"] += 1
+
+
+class StageExecutor:
+    """Выполнение блокирующих этапов конвейера в отдельных ограниченных пулах"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @classmethod
+    def from_config(cls, stages: Dict = None):
+        executor = cls()
+        for name, options in (stages or Config.EXECUTOR_STAGES).items():
+            executor.add_stage(name, **options)
+        return executor
+
+    def add_stage(self, name: str, kind: str = "thread", workers: int = 4,
+                  max_pending: int = 32, timeout: float = 30.0):
+        self.stages[name] = _Stage(name, kind, workers, max_pending, timeout)
+
+    async def run(self, stage_name: str, fn, *args, **kwargs):
+        """Запуск функции в пуле этапа с контролем очереди и таймаутом"""
+        stage = self.stages[stage_name]
+        with stage.lock:
+            if stage.pending >= stage.max_pending:
+                stage.stats["rejected"] += 1
+                raise StageOverloaded(stage_name)
+            stage.pending += 1
+            stage.stats["submitted"] += 1
+
+        try:
+            future = stage.get_pool().submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            stage.release()
+            raise
+        # Слот освобождается по фактическому завершению работы, а не по таймауту ожидания
+        future.add_done_callback(stage.release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), stage.timeout)
+        except asyncio.TimeoutError:
+            stage.stats["timeouts"] += 1
+            raise StageTimeout(stage_name, stage.timeout)
+
+    def get_stats(self) -> Dict:
+        return {
+            name: dict(stage.stats, pending=stage.pending, workers=stage.workers)
+            for name, stage in self.stages.items()
+        }
+
+    def shutdown(self, wait: bool = True):
+        for stage in self.stages.values():
+            if stage.pool is not None:
+                stage.pool.shutdown(wait=wait, cancel_futures=True)
+                stage.pool = None
@@ -0,0 +1,90 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+import threading
+from config import Config
+
+
+def trigrams(term: str) -> set:
+    """Триграммы символов с дополнением пробелами по краям (как в pg_trgm)"""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Индекс триграмм по словарю терминов: отображение неизвестных основ слов
+    (опечатки, ошибки распознавания речи) на ближайшие термины словаря"""
+
+    def __init__(self, terms: Iterable[str], threshold: float = Config.FUZZY_THRESHOLD,
+                 min_length: int = Config.FUZZY_MIN_LENGTH):
+        self.threshold = threshold
+        self.min_length = min_length
+        self.vocabulary = set()
+        self.terms = []
+        self.sizes = []  # число триграмм термина
+        # триграмма -> номера терминов, упорядоченные по числу триграмм
+        self.postings = {}
+
+        for term in sorted(terms, key=lambda term: len(trigrams(term))):
+            self.vocabulary.add(term)
+            if len(term) < min_length or term.isdigit():
+                continue
+            grams = trigrams(term)
+            position = len(self.terms)
+            self.terms.append(term)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+        self.nearest = lru_cache(maxsize=Config.FUZZY_CACHE_SIZE)(self._nearest)
+        self.stats = {"exact": 0, "corrected": 0, "unmatched": 0}
+        self._stats_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def _nearest(self, term: str) -> Optional[str]:
+        """Ближайший термин по сходству триграмм (общие / все различные) не ниже порога"""
+        grams = trigrams(term)
+        size = len(grams)
+        # Сходство не достигнет порога, если число триграмм термина вне [size * t, size / t]
+        low = bisect_left(self.sizes, size * self.threshold)
+        high = bisect_right(self.sizes, size / self.threshold)
+
+        shared = Counter()
+        for gram in grams:
+            positions = self.postings.get(gram)
+            if positions:
+                shared.update(positions[bisect_left(positions, low):bisect_left(positions, high)])
+
+        best, best_similarity = None, self.threshold
+        for position, count in shared.items():
+            similarity = count / (size + self.sizes[position] - count)
+            if similarity > best_similarity or (similarity == best_similarity and best is None):
+                best, best_similarity = position, similarity
+        return None if best is None else self.terms[best]
+
+    def correct(self, tokens: List[str]) -> List[str]:
+        """Замена основ слов, отсутствующих в словаре, ближайшими терминами;
+        слова без близких терминов сохраняются как есть"""
+        corrected = []
+        counts = Counter()
+        for token in tokens:
+            if token in self.vocabulary:
+                counts["exact"] += 1
+            elif len(token) >= self.min_length and not token.isdigit():
+                match = self.nearest(token)
+                counts["corrected" if match else "unmatched"] += 1
+                token = match or token
+            corrected.append(token)
+        with self._stats_lock:
+            for name, count in counts.items():
+                self.stats[name] += count
+        return corrected
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["terms"] = len(self.vocabulary)
+        return stats
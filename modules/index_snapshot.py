@@ -0,0 +1,270 @@
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from config import Config
+from modules.search_index import SearchIndex
+
+MAGIC = b"SIDX"
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+
+def build_params_hash() -> str:
+    """Хэш параметров построения: при их изменении старые снимки не используются"""
+    params = {
+        "format": FORMAT_VERSION,
+        "k1": Config.BM25_K1,
+        "b": Config.BM25_B,
+        "title_weight": Config.TITLE_WEIGHT,
+        "passage_max_chars": Config.PASSAGE_MAX_CHARS,
+        "stop_words": sorted(Config.STOP_WORDS),
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def snapshot_path(directory, corpus_version: int, generation: Optional[str] = None) -> Path:
+    """Снимок для каждой версии корпуса и набора параметров - отдельный файл:
+    отображенные файлы не перезаписываются"""
+    return Path(directory) / f"search_index.v{corpus_version}.{generation or 0}.{build_params_hash()}.bin"
+
+
+@contextmanager
+def build_lock(path, timeout: float = Config.INDEX_BUILD_LOCK_TIMEOUT):
+    """Межпроцессная блокировка построения снимка (файл-флаг): снимок строит один воркер,
+    остальные ждут его; флаг старше timeout считается брошенным"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock = path.with_name(path.name + ".lock")
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime > timeout:
+                    lock.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.2)
+    try:
+        yield
+    finally:
+        try:
+            lock.unlink()
+        except OSError:
+            pass
+
+
+def _csr(terms, postings):
+    """Списки вхождений в виде столбцов: смещения по терминам, позиции, частоты"""
+    offsets, positions, frequencies = array('q', [0]), array('i'), array('f')
+    for term in terms:
+        entry = postings.get(term)
+        if entry is not None:
+            positions.extend(entry[0])
+            frequencies.extend(entry[1])
+        offsets.append(len(positions))
+    return offsets, positions, frequencies
+
+
+def _strings(values):
+    """Строки в одном блоке UTF-8 со смещениями"""
+    offsets, blob = array('q', [0]), bytearray()
+    for value in values:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, array('B', blob)
+
+
+def save_snapshot(index: SearchIndex, path, corpus_version: int = 0, generation: Optional[str] = None) -> Path:
+    """Запись индекса в компактный файл; файл появляется атомарно (os.replace)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Термины упорядочены по байтам UTF-8 для двоичного поиска по отображенному словарю
+    terms = sorted(index.postings, key=lambda term: term.encode("utf-8"))
+    term_offsets, term_blob = _strings(terms)
+    postings = _csr(terms, index.postings)
+    passage_postings = _csr(terms, index.passage_postings)
+    passages = [index.get_passage(i) for i in range(len(index.passages))]
+    text_offsets, text_blob = _strings(passage["text"] for passage in passages)
+
+    columns = {
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "posting_offsets": postings[0],
+        "posting_docs": postings[1],
+        "posting_tf": postings[2],
+        "passage_posting_offsets": passage_postings[0],
+        "passage_posting_ids": passage_postings[1],
+        "passage_posting_tf": passage_postings[2],
+        "doc_lengths": array('f', index.doc_lengths),
+        "passage_ids": array('i', (-1 if passage["id"] is None else passage["id"] for passage in passages)),
+        "passage_starts": array('i', (passage["start"] for passage in passages)),
+        "passage_ends": array('i', (passage["end"] for passage in passages)),
+        "passage_text_offsets": text_offsets,
+        "passage_text": text_blob,
+    }
+    docs = json.dumps(index.docs, ensure_ascii=False).encode("utf-8")
+
+    sections, position = {}, 0
+    for name, column in columns.items():
+        sections[name] = [position, column.typecode, len(column)]
+        position += -(-len(column) * column.itemsize // ALIGNMENT) * ALIGNMENT
+    sections["docs"] = [position, "B", len(docs)]
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "corpus_version": corpus_version,
+        "generation": generation,
+        "build_params": build_params_hash(),
+        "k1": index.k1,
+        "b": index.b,
+        "title_weight": index.title_weight,
+        "avg_doc_length": index.avg_doc_length,
+        "sections": sections,
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            for name, column in columns.items():
+                f.seek(data_start + sections[name][0])
+                column.tofile(f)
+            f.seek(data_start + sections["docs"][0])
+            f.write(docs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+class MappedSearchIndex(SearchIndex):
+    """Индекс, отображенный из снимка только для чтения: процессы делят одни страницы памяти"""
+
+    def __init__(self, path, stem: Callable[[str], str] = None, corpus_version: Optional[int] = None,
+                 generation: Optional[str] = None):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path}: не является снимком поискового индекса")
+        header_length = struct.unpack("<I", view[len(MAGIC):len(MAGIC) + 4])[0]
+        header = json.loads(bytes(view[len(MAGIC) + 4:len(MAGIC) + 4 + header_length]))
+        if header["format"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path}: несовместимый формат снимка")
+        if header.get("build_params") != build_params_hash():
+            raise ValueError(f"{path}: снимок построен с другими параметрами")
+        if corpus_version is not None and (header["corpus_version"], header.get("generation")) != (corpus_version, generation):
+            raise ValueError(f"{path}: снимок другой версии корпуса")
+
+        super().__init__(stem, header["k1"], header["b"], header["title_weight"])
+        self.path = Path(path)
+        self.corpus_version = header["corpus_version"]
+        self.generation = header.get("generation")
+        self.avg_doc_length = header["avg_doc_length"]
+
+        data_start = -(-(len(MAGIC) + 4 + header_length) // ALIGNMENT) * ALIGNMENT
+        columns = {}
+        for name, (offset, typecode, count) in header["sections"].items():
+            start = data_start + offset
+            columns[name] = view[start:start + count * array(typecode).itemsize].cast(typecode)
+
+        self._term_offsets = columns["term_offsets"]
+        self._term_blob = columns["term_blob"]
+        self._postings = (columns["posting_offsets"], columns["posting_docs"], columns["posting_tf"])
+        self._passage_postings = (
+            columns["passage_posting_offsets"], columns["passage_posting_ids"], columns["passage_posting_tf"]
+        )
+        self._passage_ids = columns["passage_ids"]
+        self._passage_starts = columns["passage_starts"]
+        self._passage_ends = columns["passage_ends"]
+        self._passage_text_offsets = columns["passage_text_offsets"]
+        self._passage_text = columns["passage_text"]
+        self.doc_lengths = columns["doc_lengths"]
+
+        # Метаданные документов небольшие и нужны при фильтрации - загружаются в память
+        self.docs = [dict(doc, passages=tuple(doc["passages"])) for doc in json.loads(columns["docs"].tobytes())]
+
+    @property
+    def term_count(self) -> int:
+        return len(self._term_offsets) - 1
+
+    def terms(self):
+        offsets, blob = self._term_offsets, self._term_blob
+        for position in range(len(offsets) - 1):
+            yield blob[offsets[position]:offsets[position + 1]].tobytes().decode("utf-8")
+
+    def _term_position(self, term: str) -> Optional[int]:
+        """Двоичный поиск термина в отображенном словаре"""
+        key = term.encode("utf-8")
+        offsets, blob = self._term_offsets, self._term_blob
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and blob[offsets[lo]:offsets[lo + 1]].tobytes() == key:
+            return lo
+        return None
+
+    def _slice(self, columns, term: str):
+        position = self._term_position(term)
+        if position is None:
+            return None
+        offsets, positions, frequencies = columns
+        lo, hi = offsets[position], offsets[position + 1]
+        if lo == hi:
+            return None
+        return positions[lo:hi], frequencies[lo:hi]
+
+    def get_postings(self, term: str):
+        return self._slice(self._postings, term)
+
+    def get_passage_postings(self, term: str):
+        return self._slice(self._passage_postings, term)
+
+    def get_passage(self, position: int) -> Dict:
+        offsets = self._passage_text_offsets
+        passage_id = self._passage_ids[position]
+        return {
+            "id": None if passage_id < 0 else passage_id,
+            "text": self._passage_text[offsets[position]:offsets[position + 1]].tobytes().decode("utf-8"),
+            "start": self._passage_starts[position],
+            "end": self._passage_ends[position],
+        }
+
+
+def load_snapshot(path, stem: Callable[[str], str] = None, corpus_version: Optional[int] = None,
+                  generation: Optional[str] = None) -> MappedSearchIndex:
+    """Отображение снимка; версия корпуса и параметры построения сверяются с заголовком"""
+    return MappedSearchIndex(path, stem, corpus_version, generation)
+
+
+def remove_stale_snapshots(directory, keep: Path):
+    """Удаление снимков прошлых версий; в POSIX отображенный файл остается доступен до закрытия"""
+    for path in Path(directory).glob("search_index.*.bin"):
+        if path != keep:
+            try:
+                path.unlink()
+            except OSError:
+                pass
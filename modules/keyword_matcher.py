@@ -0,0 +1,67 @@
+from collections import deque
+from config import Config
+from functools import lru_cache
+from typing import Dict, FrozenSet, Hashable, List
+
+
+class KeywordMatcher:
+    """Автомат Ахо-Корасик: поиск всех шаблонов за один проход по тексту"""
+
+    def __init__(self, patterns: Dict[Hashable, List[str]]):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for label, words in patterns.items():
+            for word in words:
+                self._add(word.lower(), label)
+        self._build_failure_links()
+
+    def _add(self, word: str, label: Hashable):
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            node = next_node
+        self._output[node].add(label)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0) if node else 0
+                self._output[child] |= self._output[self._fail[child]]
+        self._output = [frozenset(labels) for labels in self._output]
+
+    def labels(self, text: str) -> FrozenSet:
+        """Множество меток всех шаблонов, входящих в текст как подстроки"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        found = set()
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return frozenset(found)
+
+
+@lru_cache(maxsize=None)
+def keyword_matcher() -> KeywordMatcher:
+    """Общий автомат по таблице Config.KEYWORD_PATTERNS с метками (вид, код)"""
+    return KeywordMatcher({
+        (kind, code): words
+        for kind, groups in Config.KEYWORD_PATTERNS.items()
+        for code, words in groups.items()
+    })
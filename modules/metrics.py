@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+import threading
+import time
+
+# Границы корзин гистограмм задержки, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: запись - один bisect и сложение под блокировкой"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # метки -> [счетчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Значения, снимаемые в момент экспорта (например, статистика кэша)"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label: str,
+                 callback: Callable[[], Dict[str, float]]):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label = label
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels((self.label,), (key,))} {value}"
+            for key, value in self.callback().items()
+            if isinstance(value, (int, float))
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def callback(self, name: str, help_text: str, label: str, callback, kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, kind, label, callback))
+
+    def render(self) -> str:
+        """Экспорт в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "assistant_stage_duration_seconds", "Длительность этапов обработки запроса", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "assistant_stage_errors_total", "Ошибки на этапах обработки запроса", ("stage", "error"))
+ROWS_SCANNED = REGISTRY.counter(
+    "assistant_search_rows_scanned_total", "Просмотрено строк БД или вхождений индекса при поиске", ("backend",))
+
+
+@contextmanager
+def timed(stage: str, timings: Optional[Dict[str, float]] = None):
+    """Замер этапа: гистограмма, счетчик ошибок и (необязательно) тайминги запроса"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Значение заголовка Server-Timing"""
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items())
@@ -1,11 +1,11 @@
-import nltk
 import re
 import string
+import threading
 from pathlib import Path
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import SnowballStemmer
+from functools import lru_cache
+from collections import Counter
 from config import Config
+from modules.keyword_matcher import keyword_matcher
 
 # Скачиваем необходимые данные NLTK (выполняется один раз при первом запуске)
 #try:
@@ -17,20 +17,13 @@ from config import Config
 
 class NLPProcessor:
     def __init__(self):
-        self.stemmer = SnowballStemmer("russian")
-        self.stop_words = set(stopwords.words("russian") + list(Config.STOP_WORDS))
+        # Ресурсы NLTK загружаются при первом использовании или при прогреве (load):
+        # импорт nltk занимает больше секунды и не должен задерживать старт приложения
+        self.ready = False
+        self._load_lock = threading.Lock()
         
-        self.category_patterns = {
-            "FIS": ["финанс", "поддержк", "субсид", "грант", "бюджет"],
-            "LAW": ["закон", "норматив", "постановлени", "правов", "регулирован"],
-            "STA": ["статистик", "данн", "отчет", "показател", "ввп", "экономик"]
-        }
-        
-        self.type_patterns = {
-            "03": ["закон", "постановлени", "приказ", "норматив", "правов"],
-            "12": ["статистик", "отчет", "данн", "показател", "анализ"],
-            "07": ["методич", "рекомендац", "инструкц", "руководств", "правил"]
-        }
+        self.category_patterns = Config.KEYWORD_PATTERNS["category"]
+        self.type_patterns = Config.KEYWORD_PATTERNS["doc_type"]
 
         self.synonyms = {
             "финанс": ["деньги", "бюджет", "финансирование"],
@@ -40,24 +33,64 @@ class NLPProcessor:
         def expand_with_synonyms(self, token):
             return [token] + self.synonyms.get(token, [])
 
+    def load(self):
+        """Загрузка стеммера, стоп-слов и автомата ключевых слов (однократно)"""
+        with self._load_lock:
+            if self.ready:
+                return self
+            from nltk.tokenize import word_tokenize
+            from nltk.corpus import stopwords
+            from nltk.stem import SnowballStemmer
+            
+            self.word_tokenize = word_tokenize
+            self.stemmer = SnowballStemmer("russian")
+            self.stop_words = set(stopwords.words("russian") + list(Config.STOP_WORDS))
+            self.matcher = keyword_matcher()
+            
+            # Мемоизация основ и меток ключевых слов: словарь запросов быстро повторяется.
+            # Атрибуты экземпляра заменяют одноименные методы-загрузчики
+            self.stem = lru_cache(maxsize=Config.STEM_CACHE_SIZE)(self.stemmer.stem)
+            self.token_labels = lru_cache(maxsize=Config.STEM_CACHE_SIZE)(self.matcher.labels)
+            self.ready = True
+        return self
+    
+    def stem(self, word):
+        return self.load().stem(word)
+    
+    def token_labels(self, token):
+        return self.load().token_labels(token)
+    
     def preprocess_text(self, text):
         """Улучшенная предобработка текста"""
+        if not self.ready:
+            self.load()
         text = text.lower().translate(str.maketrans('', '', string.punctuation))
-        tokens = word_tokenize(text, language="russian")
-        return [self.stemmer.stem(token) for token in tokens if token not in self.stop_words]
+        tokens = self.word_tokenize(text, language="russian")
+        return [self.stem(token) for token in tokens if token not in self.stop_words]
 
     def classify_query(self, query_text):
         """Улучшенная классификация с обработкой краевых случаев"""
         if not query_text or len(query_text) < 2:
             return {"tokens": [], "category": None, "doc_type": None, "query_code": None}
-        tokens = self.preprocess_text(query_text)
+        return self.classify_tokens(self.preprocess_text(query_text))
+    
+    def classify_tokens(self, tokens):
+        """Классификация по уже нормализованным основам слов"""
+        # Один проход автомата по токену дает и категории, и типы документов
+        category_scores = Counter()
+        type_scores = Counter()
+        for token in tokens:
+            labels = self.token_labels(token)
+            if not labels:
+                continue
+            for code in self.category_patterns:
+                if ("category", code) in labels:
+                    category_scores[code] += 1
+            for code in self.type_patterns:
+                if ("doc_type", code) in labels:
+                    type_scores[code] += 1
         
          # Улучшенное определение категории с пороговым значением
-        category_scores = {}
-        for token in tokens:
-            for category, patterns in self.category_patterns.items():
-                if any(pattern in token for pattern in patterns):
-                    category_scores[category] = category_scores.get(category, 0) + 1
         best_category = max(category_scores, key=category_scores.get) if category_scores and max(category_scores.values()) >= 2 else None
         
         # Автоматическое определение типа документа для категории
@@ -69,15 +102,18 @@ class NLPProcessor:
         elif best_category == "STA":
             doc_type = "12"  # Статистические отчеты
             # Дополнительная проверка по ключевым словам
-        type_scores = {}
-        for token in tokens:
-            for doc_type_code, patterns in self.type_patterns.items():
-                if any(pattern in token for pattern in patterns):
-                    type_scores[doc_type_code] = type_scores.get(doc_type_code, 0) + 1
         best_type = max(type_scores, key=type_scores.get) if type_scores else doc_type
         return {
             "tokens": tokens,
             "category": best_category,
             "doc_type": best_type,
             "query_code": f"{best_category}-{best_type}" if best_category and best_type else None
-            }
\ No newline at end of file
+            }
+    
+    def classify_batch(self, queries):
+        """Классификация пачки запросов; повторяющиеся запросы обрабатываются один раз"""
+        results = {}
+        for query_text in queries:
+            if query_text not in results:
+                results[query_text] = self.classify_query(query_text)
+        return [results[query_text] for query_text in queries]
@@ -0,0 +1,73 @@
+from config import Config
+from typing import Callable, Dict, List, Optional, Tuple
+import re
+
+SENTENCE_BOUNDARY = re.compile(r'[^.!?…]+(?:[.!?…]+|$)')
+WORD = re.compile(r'\w+')
+
+
+def _sentence_spans(text: str, max_chars: int):
+    """Границы предложений; слишком длинные предложения режутся по пробелам"""
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        start, end = match.span()
+        while start < end and text[start].isspace():
+            start += 1
+        while end - start > max_chars:
+            cut = text.rfind(' ', start, start + max_chars)
+            if cut <= start:
+                cut = start + max_chars
+            yield start, cut
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        if start < end:
+            yield start, end
+
+
+def split_passages(text: str, max_chars: int = Config.PASSAGE_MAX_CHARS) -> List[Tuple[int, int]]:
+    """Разбиение текста на фрагменты из целых предложений со смещениями (start, end)"""
+    passages = []
+    current_start = current_end = None
+    for start, end in _sentence_spans(text or "", max_chars):
+        if current_start is not None and end - current_start > max_chars:
+            passages.append((current_start, current_end))
+            current_start = None
+        if current_start is None:
+            current_start = start
+        current_end = end
+    if current_start is not None:
+        passages.append((current_start, current_end))
+    return passages
+
+
+def highlight_offsets(text: str, query_terms, stem: Callable[[str], str]) -> List[List[int]]:
+    """Смещения слов фрагмента, основы которых совпали с терминами запроса"""
+    return [
+        [match.start(), match.end()]
+        for match in WORD.finditer(text)
+        if stem(match.group().lower()) in query_terms
+    ]
+
+
+def best_passage(passages: List[Dict], query_tokens: List[str], stem: Callable[[str], str]) -> Optional[Dict]:
+    """Выбор фрагмента с наибольшим числом совпавших терминов запроса"""
+    if not passages:
+        return None
+    query_terms = set(query_tokens)
+    best, best_key, best_highlights = passages[0], (-1, -1), []
+    for passage in passages:
+        highlights = highlight_offsets(passage["text"], query_terms, stem)
+        matched = {stem(passage["text"][start:end].lower()) for start, end in highlights}
+        key = (len(matched), len(highlights))
+        if key > best_key:
+            best, best_key, best_highlights = passage, key, highlights
+    return make_passage_result(best, best_highlights)
+
+
+def make_passage_result(passage: Dict, highlights: List[List[int]]) -> Dict:
+    return {
+        "text": passage["text"],
+        "start": passage["start"],
+        "end": passage["end"],
+        "highlights": highlights
+    }
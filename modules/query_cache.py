@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from config import Config
+from typing import Dict, Hashable, List, Optional
+import threading
+import time
+
+_MISSING = object()
+
+
+class QueryCache:
+    """Кэш результатов поиска с вытеснением LRU и временем жизни записей"""
+
+    def __init__(self, max_entries: int = Config.QUERY_CACHE_SIZE, ttl: float = Config.QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(query_tokens: List[str], category_code: Optional[str] = None,
+                 doc_type_code: Optional[str] = None) -> Hashable:
+        """Ключ по отсортированным основам слов и фильтрам запроса"""
+        return (tuple(sorted(query_tokens)), category_code, doc_type_code)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.stats["misses"] += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        """Сброс кэша при изменении корпуса документов"""
+        with self._lock:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
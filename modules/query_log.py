@@ -0,0 +1,91 @@
+from config import Config
+from typing import Callable, Dict, List
+import queue
+import threading
+import time
+
+
+class QueryLogWriter:
+    """Фоновая пакетная запись журнала запросов"""
+
+    def __init__(self, write_batch: Callable[[List[Dict]], None],
+                 max_queue: int = Config.LOG_QUEUE_SIZE,
+                 batch_size: int = Config.LOG_BATCH_SIZE,
+                 flush_interval: float = Config.LOG_FLUSH_INTERVAL):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def backlog(self) -> int:
+        return self.queue.qsize()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, record: Dict) -> bool:
+        """Постановка записи в очередь без блокировки вызывающего"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка с записью всех накопленных записей"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+        # Дозапись остатка очереди при завершении
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _collect_batch(self) -> List[Dict]:
+        """Сбор пакета до batch_size записей или до истечения flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _flush(self, batch: List[Dict]):
+        try:
+            self.write_batch(batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            print(f"Ошибка записи журнала запросов: {e}")
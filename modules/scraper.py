@@ -1,7 +1,12 @@
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit
+from collections import deque
+import asyncio
+import hashlib
 import json
+import os
+import tempfile
 from pathlib import Path
 from config import Config
 import time
@@ -13,61 +18,319 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config import Config
+from modules.keyword_matcher import keyword_matcher
+from modules.rate_limit import TokenBucket
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+def normalize_url(url):
+    """Нормализация URL для дедупликации: без фрагмента, хост в нижнем регистре, без порта по умолчанию"""
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    netloc = parts.netloc.lower()
+    if (parts.scheme == 'http' and netloc.endswith(':80')) or (parts.scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path or '/', parts.query, ''))
 
 class SiteScraper:
-    def __init__(self, base_url="https://economy.gov.ru/"):
-        self.base_url = base_url
+    def __init__(self, base_url="https://economy.gov.ru/", known_pages=None,
+                 output_path=None, checkpoint_path=None):
+        self.base_url = normalize_url(base_url)
         self.visited_urls = set()
+        self.seen_urls = set()
         self.data = []
+        self.documents_saved = 0
+        self.stats = {}
+        
+        # Потоковая запись: каждая запись сразу дописывается в NDJSON, а не копится в памяти
+        self.output_path = Path(output_path) if output_path else None
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.output = None
+        self.frontier = deque()
+        self.in_flight_urls = set()
+        self.pages_since_checkpoint = 0
+        self.resumed = False
+        
+        # Инкрементальный режим: url -> {"etag", "last_modified", "content_hash"} прошлого обхода
+        self.known_pages = {normalize_url(url): state for url, state in (known_pages or {}).items()}
+        self.unchanged_urls = set()
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        self.session.headers.update({'User-Agent': USER_AGENT})
+        
+        # Только страницы с контентом: хотя бы один уровень вложенности пути
+        self.content_url_pattern = re.compile(re.escape(urlsplit(self.base_url).netloc) + r'/.+/')
+        self.host_buckets = {}
+
+    def enqueue(self, frontier, url):
+        """Добавление URL в очередь с дедупликацией в момент постановки"""
+        url = normalize_url(url)
+        if url in self.seen_urls or not self.is_valid_url(url):
+            return False
+        self.seen_urls.add(url)
+        frontier.append(url)
+        return True
+
+    def initial_frontier(self, resume=False):
+        """Стартовая очередь: контрольная точка прерванного обхода или корень сайта и страницы прошлого обхода"""
+        # Дописывать в файл результатов можно, только если обход продолжается с контрольной точки
+        self.resumed = bool(resume and self.checkpoint_path and self.checkpoint_path.exists())
+        if self.resumed:
+            self.frontier = self.load_checkpoint()
+            return self.frontier
+        
+        frontier = deque([self.base_url])
+        self.seen_urls.add(self.base_url)
+        for url in self.known_pages:
+            self.enqueue(frontier, url)
+        self.frontier = frontier
+        return frontier
+
+    def open_output(self, resume=False):
+        if self.output_path and self.output is None:
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            self.output = open(self.output_path, 'a' if resume else 'w', encoding='utf-8')
+
+    def close_output(self, completed=False):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+        # Завершенному обходу контрольная точка больше не нужна
+        if completed and self.checkpoint_path and self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+
+    def emit(self, record):
+        """Запись результата: строка NDJSON в файл или элемент self.data без файла"""
+        if self.output is not None:
+            self.output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.output.flush()
+        else:
+            self.data.append(record)
+        if record.get("status") != "gone":
+            self.documents_saved += 1
+        self.pages_since_checkpoint += 1
+        if self.checkpoint_path and self.pages_since_checkpoint >= Config.SCRAPER_CHECKPOINT_EVERY:
+            self.save_checkpoint()
 
-    def scrape_site(self, max_pages=50):
+    def save_checkpoint(self):
+        """Атомарное сохранение очереди и множеств посещенных URL"""
+        state = {
+            "base_url": self.base_url,
+            # URL, загружаемые в момент сохранения, возвращаются в очередь
+            "frontier": list(self.in_flight_urls) + list(self.frontier),
+            "seen": list(self.seen_urls),
+            "visited": list(self.visited_urls),
+            "unchanged": list(self.unchanged_urls)
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.checkpoint_path.parent, prefix=self.checkpoint_path.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.checkpoint_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.pages_since_checkpoint = 0
+
+    def load_checkpoint(self):
+        """Восстановление состояния прерванного обхода"""
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.seen_urls = set(state["seen"])
+        self.visited_urls = set(state["visited"])
+        self.unchanged_urls = set(state.get("unchanged", []))
+        
+        # Записи, успевшие попасть в файл после контрольной точки, повторно не загружаются
+        written = set()
+        if self.output_path and self.output_path.exists():
+            with open(self.output_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        written.add(record["url"])
+                        if record.get("status") != "gone":
+                            self.documents_saved += 1
+        self.visited_urls |= written
+        return deque(url for url in state["frontier"] if url not in written)
+
+    def conditional_headers(self, url):
+        """Заголовки условного запроса по данным прошлого обхода"""
+        known = self.known_pages.get(url) or {}
+        headers = {}
+        if known.get("etag"):
+            headers['If-None-Match'] = known["etag"]
+        if known.get("last_modified"):
+            headers['If-Modified-Since'] = known["last_modified"]
+        return headers
+
+    def process_response(self, url, status, headers, body, encoding=None):
+        """Обработка ответа с учетом 304 и хеша содержимого: (исход, запись или None, ссылки).
+        Состояние обхода не меняется: метод выполняется в рабочих потоках"""
+        known = self.known_pages.get(url)
+        if status == 304:
+            # Ссылки неизменившейся страницы берутся из прошлого обхода: новые страницы за ней не теряются
+            return "not_modified", None, known.get("links", []) if known else []
+        if status in (404, 410):
+            return "gone", {"url": url, "status": "gone"} if known is not None else None, []
+        if status != 200:
+            return "skipped", None, []
+        
+        # Неизменившееся содержимое не разбирается повторно
+        content_hash = hashlib.sha256(body).hexdigest()
+        if known is not None and known.get("content_hash") == content_hash:
+            return "unchanged", None, known.get("links", [])
+        
+        record, links = self.parse_page(url, body.decode(encoding or 'utf-8', errors='replace'))
+        if record:
+            record.update({
+                "status": "changed" if known is not None else "new",
+                "etag": headers.get('ETag'),
+                "last_modified": headers.get('Last-Modified'),
+                "content_hash": content_hash,
+                "links": self.scoped_links(links)
+            })
+        elif known is not None:
+            # Страница осталась, но контента на ней больше нет
+            record = {"url": url, "status": "gone"}
+        return "fetched", record, links
+
+    def apply_response(self, url, result):
+        """Учет результата в состоянии обхода и запись; вызывается только из потока обхода
+        (цикла событий), поэтому запись и контрольные точки не пересекаются"""
+        outcome, record, links = result
+        if outcome in ("fetched", "unchanged"):
+            self.visited_urls.add(url)
+        if outcome in ("not_modified", "unchanged"):
+            self.unchanged_urls.add(url)
+        if record:
+            self.emit(record)
+        return links
+
+    def scrape_site(self, max_pages=50, resume=False):
         """Основной метод для парсинга сайта"""
-        queue = [self.base_url]
+        queue = self.initial_frontier(resume)
+        self.open_output(self.resumed)
         
-        while queue and len(self.data) < max_pages:
-            url = queue.pop(0)
-            
-            if url in self.visited_urls:
-                continue
+        while queue and self.documents_saved < max_pages:
+            url = queue.popleft()
                 
             print(f"Обработка: {url}")
             
+            self.in_flight_urls.add(url)
             try:
-                response = self.session.get(url, timeout=10)
-                if response.status_code != 200:
-                    continue
-                    
-                soup = BeautifulSoup(response.text, 'html.parser')
-                self.visited_urls.add(url)
-                
-                # Извлекаем данные со страницы
-                self.extract_page_data(url, soup)
+                response = self.session.get(url, timeout=10, headers=self.conditional_headers(url))
+                links = self.apply_response(url, self.process_response(
+                    url, response.status_code, response.headers, response.content, response.encoding))
                 
                 # Находим новые ссылки для обработки
-                for link in soup.find_all('a', href=True):
-                    absolute_url = urljoin(url, link['href'])
-                    if self.is_valid_url(absolute_url):
-                        queue.append(absolute_url)
+                for link in links:
+                    self.enqueue(queue, link)
                 
                 time.sleep(1)  # Задержка между запросами
                 
             except Exception as e:
                 print(f"Ошибка при обработке {url}: {str(e)}")
                 continue
+            finally:
+                self.in_flight_urls.discard(url)
+        
+        self.close_output(completed=True)
 
-    def is_valid_url(self, url):
-        """Проверяет, нужно ли обрабатывать URL"""
+    def host_bucket(self, url):
+        """Ограничение частоты запросов к одному хосту"""
+        host = urlsplit(url).netloc
+        bucket = self.host_buckets.get(host)
+        if bucket is None:
+            bucket = self.host_buckets[host] = TokenBucket(Config.SCRAPER_HOST_RATE, Config.SCRAPER_HOST_BURST)
+        return bucket
+
+    def parse_page(self, url, html):
+        """Разбор страницы: запись документа (или None) и найденные ссылки"""
+        soup = BeautifulSoup(html, 'html.parser')
+        record = self.build_record(url, soup)
+        links = [urljoin(url, link['href']) for link in soup.find_all('a', href=True)]
+        return record, links
+
+    async def scrape_site_async(self, max_pages=50, concurrency=Config.SCRAPER_CONCURRENCY, resume=False):
+        """Параллельный обход: до concurrency загрузок одновременно через общий пул соединений"""
+        import aiohttp
+        
+        frontier = self.initial_frontier(resume)
+        self.open_output(self.resumed)
+        in_flight = 0
+        fetched = 0
+        started = time.monotonic()
+        
+        async def worker(http):
+            nonlocal in_flight, fetched
+            while self.documents_saved < max_pages:
+                if not frontier:
+                    if not in_flight:
+                        return
+                    await asyncio.sleep(0.05)
+                    continue
+                
+                url = frontier.popleft()
+                in_flight += 1
+                self.in_flight_urls.add(url)
+                try:
+                    await self.host_bucket(url).acquire()
+                    async with http.get(url, headers=self.conditional_headers(url)) as response:
+                        body = await response.read()
+                        status, headers, encoding = response.status, response.headers, response.charset
+                    fetched += 1
+                    
+                    # Разбор HTML не должен блокировать остальные загрузки; запись - в цикле событий
+                    result = await asyncio.to_thread(self.process_response, url, status, headers, body, encoding)
+                    links = self.apply_response(url, result)
+                    for link in links:
+                        self.enqueue(frontier, link)
+                except Exception as e:
+                    print(f"Ошибка при обработке {url}: {str(e)}")
+                finally:
+                    in_flight -= 1
+                    self.in_flight_urls.discard(url)
+        
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        timeout = aiohttp.ClientTimeout(total=Config.SCRAPER_TIMEOUT)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={'User-Agent': USER_AGENT}) as http:
+            await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        self.close_output(completed=True)
+        
+        elapsed = time.monotonic() - started
+        self.stats = {
+            "pages_fetched": fetched,
+            "documents": self.documents_saved,
+            "unchanged": len(self.unchanged_urls),
+            "seconds": round(elapsed, 2),
+            "pages_per_second": round(fetched / elapsed, 2) if elapsed else 0.0
+        }
+        print(f"Загружено страниц: {fetched} за {elapsed:.1f} с ({self.stats['pages_per_second']} стр/с)")
+        return self.stats
+
+    def in_scope(self, url):
+        """URL относится к обходу: страница сайта с контентом, не файл"""
         return (url.startswith(self.base_url) and
                 not any(ext in url for ext in ['.pdf', '.doc', '.xls']) and
-                url not in self.visited_urls and
-                re.search(r'economy\.gov\.ru/.+/', url))  # Только страницы с контентом
+                self.content_url_pattern.search(url))  # Только страницы с контентом
+
+    def is_valid_url(self, url):
+        """Проверяет, нужно ли обрабатывать URL"""
+        return url not in self.visited_urls and self.in_scope(url)
+
+    def scoped_links(self, links):
+        """Ссылки страницы для сохранения вместе с ее состоянием"""
+        return sorted({url for url in map(normalize_url, links) if self.in_scope(url)})
 
     def extract_page_data(self, url, soup):
         """Извлекает данные с одной страницы"""
+        record = self.build_record(url, soup)
+        if record:
+            self.emit(record)
+
+    def build_record(self, url, soup):
+        """Формирует запись документа по странице (None для страниц без контента)"""
         title = soup.title.string if soup.title else "Без названия"
         
         # Основной контент страницы (адаптируйте под структуру сайта)
@@ -84,41 +347,31 @@ class SiteScraper:
         # Определяем категорию и тип документа (примерная логика)
         doc_category, doc_type = self.classify_document(url, title)
         
-        self.data.append({
-            "title": title,
+        return {
+            "title": str(title),
             "content": content,
             "url": url,
             "type_code": doc_type,
             "category_code": doc_category,
             "access_code": "A"  # По умолчанию открытый доступ
-        })
+        }
 
     def classify_document(self, url, title):
         """Определяет категорию и тип документа"""
-        # Пример простого классификатора по ключевым словам
-        category_map = [
-            (r'финанс|поддержк|субсид|бюджет', "FIS"),
-            (r'закон|норматив|правов|регулирован', "LAW"), 
-            (r'статистик|данн|отчет|показател|ввп', "STA")
-        ]
-        
-        type_map = [
-            (r'закон|постановлени|приказ|норматив|правов', "03"),
-            (r'статистик|отчет|данн|показател|анализ', "12"),
-            (r'методич|рекомендац|инструкц|руководств|правил', "07")
-        ]
-        
-        # Определяем категорию
+        # Общая с NLPProcessor таблица основ, один проход автомата по заголовку
+        labels = keyword_matcher().labels((title or "").lower())
+        
+        # Определяем категорию (по порядку приоритета в таблице)
         category = "UNK"
-        for pattern, code in category_map:
-            if re.search(pattern, title, re.I):
+        for code in Config.KEYWORD_PATTERNS["category"]:
+            if ("category", code) in labels:
                 category = code
                 break
                 
         # Определяем тип
         doc_type = "00"
-        for pattern, code in type_map:
-            if re.search(pattern, title, re.I):
+        for code in Config.KEYWORD_PATTERNS["doc_type"]:
+            if ("doc_type", code) in labels:
                 doc_type = code
                 break
                 
@@ -134,10 +387,27 @@ class SiteScraper:
             
         print(f"Данные сохранены в {output_path}")
 
-def run_scraper():
-    scraper = SiteScraper()
-    scraper.scrape_site(max_pages=20)  # Ограничим для теста
-    scraper.save_to_json()
+def run_scraper(max_pages=20, concurrent=True, incremental=False, resume=False):
+    known_pages = None
+    output_dir = Config.DATA_DIR / "scraped_data"
+    output_path = output_dir / "scraped_data.ndjson"
+    checkpoint_path = output_dir / "crawl_checkpoint.json"
+    if incremental:
+        from data.db_init import load_page_state, default_delta_path
+        known_pages = load_page_state()
+        # Изменения пишутся в отдельный файл: полный файл обхода остается целым для init_db
+        output_path = default_delta_path()
+        checkpoint_path = output_dir / "crawl_checkpoint_delta.json"
+    scraper = SiteScraper(
+        known_pages=known_pages,
+        output_path=output_path,
+        checkpoint_path=checkpoint_path
+    )
+    if concurrent:
+        asyncio.run(scraper.scrape_site_async(max_pages=max_pages, resume=resume))
+    else:
+        scraper.scrape_site(max_pages=max_pages, resume=resume)  # Ограничим для теста
+    print(f"Данные сохранены в {scraper.output_path}")
     
 if __name__ == "__main__":
-    run_scraper()
\ No newline at end of file
+    run_scraper(incremental="--incremental" in sys.argv, resume="--resume" in sys.argv)
\ No newline at end of file
@@ -0,0 +1,197 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional
+import heapq
+import math
+from config import Config
+from modules.passages import split_passages, highlight_offsets, make_passage_result
+from modules.metrics import ROWS_SCANNED
+
+
+class SearchIndex:
+    """Инвертированный индекс в памяти с ранжированием BM25 и индексом фрагментов"""
+
+    def __init__(self, stem: Callable[[str], str] = None, k1: float = Config.BM25_K1,
+                 b: float = Config.BM25_B, title_weight: int = Config.TITLE_WEIGHT):
+        self.stem = stem or (lambda word: word)
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+
+        # term -> (позиции документов, взвешенные частоты)
+        self.postings = {}
+        self.doc_lengths = array('f')
+        self.docs = []
+        self.avg_doc_length = 0.0
+
+        # Фрагменты документов: term -> (позиции фрагментов, частоты); позиции возрастают
+        self.passages = []
+        self.passage_postings = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    @property
+    def term_count(self) -> int:
+        return len(self.postings)
+
+    def terms(self):
+        return iter(self.postings)
+
+    def get_postings(self, term: str):
+        return self.postings.get(term)
+
+    def get_passage_postings(self, term: str):
+        return self.passage_postings.get(term)
+
+    def get_passage(self, position: int) -> Dict:
+        return self.passages[position]
+
+    def add_document(self, doc: Dict, title_tokens: List[str], passages: List[Dict]):
+        """Добавление документа и его фрагментов в индекс (токены уже стеммированы)"""
+        position = len(self.docs)
+        doc = dict(doc, passages=(len(self.passages), len(passages)))
+        self.docs.append(doc)
+
+        term_counts = Counter()
+        for passage, tokens in passages:
+            passage_position = len(self.passages)
+            self.passages.append(passage)
+            passage_counts = Counter(tokens)
+            term_counts.update(passage_counts)
+            for term, tf in passage_counts.items():
+                positions, frequencies = self.passage_postings.setdefault(term, (array('i'), array('f')))
+                positions.append(passage_position)
+                frequencies.append(tf)
+
+        content_length = sum(term_counts.values())
+        for token in title_tokens:
+            term_counts[token] += self.title_weight
+        self.doc_lengths.append(content_length + self.title_weight * len(title_tokens))
+
+        for term, tf in term_counts.items():
+            positions, frequencies = self.postings.setdefault(term, (array('i'), array('f')))
+            positions.append(position)
+            frequencies.append(tf)
+
+    def finalize(self):
+        """Расчет статистик корпуса после загрузки всех документов"""
+        if self.docs:
+            self.avg_doc_length = sum(self.doc_lengths) / len(self.docs)
+        return self
+
+    @classmethod
+    def build(cls, documents, preprocess, stem=None):
+        """Построение индекса из словарей документов с фрагментами (или с полным текстом)"""
+        index = cls(stem)
+        for doc in documents:
+            passages = doc.pop("passages", None)
+            if passages is None:
+                content = doc.pop("content", "")
+                passages = [
+                    {"id": None, "text": content[start:end], "start": start, "end": end}
+                    for start, end in split_passages(content)
+                ]
+            index.add_document(
+                doc,
+                preprocess(doc["title"]),
+                [(passage, preprocess(passage["text"])) for passage in passages]
+            )
+        return index.finalize()
+
+    def _matches(self, doc: Dict, category_code, doc_type_code, access_id) -> bool:
+        if access_id is not None and doc["access_id"] != access_id:
+            return False
+        if category_code and doc["category"] != category_code:
+            return False
+        if doc_type_code and doc["doc_type"] != doc_type_code:
+            return False
+        return True
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def search(self, query_tokens: List[str], category_code: Optional[str] = None,
+               doc_type_code: Optional[str] = None, access_id: Optional[int] = 1,
+               limit: int = Config.SEARCH_LIMIT) -> List[Dict]:
+        """Поиск по индексу: обходятся только списки вхождений терминов запроса"""
+        return self.search_batch([query_tokens], category_code, doc_type_code, access_id, limit)[0]
+
+    def search_batch(self, queries: List[List[str]], category_code: Optional[str] = None,
+                     doc_type_code: Optional[str] = None, access_id: Optional[int] = 1,
+                     limit: int = Config.SEARCH_LIMIT) -> List[List[Dict]]:
+        """Поиск пачки запросов с общими фильтрами: документ проверяется фильтрами один раз на пачку"""
+        allowed = {}
+
+        def matches(position: int) -> bool:
+            result = allowed.get(position)
+            if result is None:
+                result = allowed[position] = self._matches(
+                    self.docs[position], category_code, doc_type_code, access_id)
+            return result
+
+        return [self._search(query_tokens, matches, limit) for query_tokens in queries]
+
+    def _search(self, query_tokens: List[str], matches, limit: int) -> List[Dict]:
+        if not self.docs or not query_tokens:
+            return []
+
+        k1, b, avgdl = self.k1, self.b, self.avg_doc_length or 1.0
+        scores = {}
+        term_weights = {}
+        scanned = 0
+
+        for term, query_tf in Counter(query_tokens).items():
+            entry = self.get_postings(term)
+            if entry is None:
+                continue
+            positions, frequencies = entry
+            idf = self._idf(len(positions)) * query_tf
+            term_weights[term] = idf
+            scanned += len(positions)
+
+            for position, tf in zip(positions, frequencies):
+                if position not in scores and not matches(position):
+                    continue
+                norm = k1 * (1 - b + b * self.doc_lengths[position] / avgdl)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        ROWS_SCANNED.inc(scanned, backend="index")
+
+        # Частичная сортировка: куча размера limit вместо сортировки всех кандидатов
+        top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [self._result(position, score, term_weights) for position, score in top]
+
+    def best_passage(self, position: int, term_weights: Dict[str, float]) -> Optional[Dict]:
+        """Лучший фрагмент документа по спискам вхождений терминов запроса"""
+        first, count = self.docs[position]["passages"]
+        if not count:
+            return None
+
+        passage_scores = {}
+        for term, weight in term_weights.items():
+            entry = self.get_passage_postings(term)
+            if entry is None:
+                continue
+            positions, frequencies = entry
+            # Вхождения фрагментов одного документа образуют непрерывный отрезок
+            lo = bisect_left(positions, first)
+            hi = bisect_left(positions, first + count, lo)
+            for i in range(lo, hi):
+                passage_scores[positions[i]] = passage_scores.get(positions[i], 0.0) + weight * frequencies[i]
+
+        best = max(passage_scores, key=lambda p: (passage_scores[p], -p)) if passage_scores else first
+        passage = self.get_passage(best)
+        return make_passage_result(passage, highlight_offsets(passage["text"], term_weights, self.stem))
+
+    def _result(self, position: int, score: float, term_weights: Dict[str, float]) -> Dict:
+        doc = self.docs[position]
+        return {
+            "id": doc["id"],
+            "title": doc["title"],
+            "url": doc["url"],
+            "score": score,
+            "passage": self.best_passage(position, term_weights)
+        }
@@ -1,6 +1,22 @@
+from collections import OrderedDict
 from config import Config
+from contextlib import contextmanager
+from modules.rate_limit import TokenBucket
+import math
 import re
 
+# Шаблоны SQL-инъекций объединены в одно выражение, компилируемое при импорте
+INJECTION_PATTERNS = [
+    r";\s*(--|#|/*)",
+    r"\b(select|insert|update|delete|drop|alter|create|exec)\b",
+    r"\b(union|having|group by)\b",
+    r"\b(and|or)\s+[\d\w]+\s*=\s*[\d\w]+\b",
+    r"'.*--",
+    r"'.*;",
+    r"'.*/\*"
+]
+INJECTION_RE = re.compile("|".join(f"(?:{pattern})" for pattern in INJECTION_PATTERNS), re.IGNORECASE)
+
 class SecurityChecker:
     @staticmethod
     def sanitize_input(input_text: str) -> str:
@@ -20,20 +36,7 @@ class SecurityChecker:
     @staticmethod
     def check_query_for_injection(query: str) -> bool:
         """Проверка на возможные SQL-инъекции"""
-        injection_patterns = [
-            r";\s*(--|#|/*)",
-            r"\b(select|insert|update|delete|drop|alter|create|exec)\b",
-            r"\b(union|having|group by)\b",
-            r"\b(and|or)\s+[\d\w]+\s*=\s*[\d\w]+\b",
-            r"'.*--",
-            r"'.*;",
-            r"'.*/\*"
-        ]
-        
-        for pattern in injection_patterns:
-            if re.search(pattern, query, re.IGNORECASE):
-                return True
-        return False
+        return INJECTION_RE.search(query) is not None
     
     @staticmethod
     def validate_query(query: str) -> tuple:
@@ -47,4 +50,92 @@ class SecurityChecker:
         if not sanitized or len(sanitized) < 3:
             return (False, "Запрос слишком короткий")
         
-        return (True, sanitized)
\ No newline at end of file
+        return (True, sanitized)
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонен до начала обработки"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float = 1.0):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """Контроль допуска: корзина токенов на клиента и лимит одновременных запросов на эндпоинт"""
+
+    def __init__(self, rate: float = Config.CLIENT_RATE, burst: float = Config.CLIENT_BURST,
+                 max_inflight: dict = None, max_clients: int = Config.MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_inflight = dict(Config.MAX_INFLIGHT if max_inflight is None else max_inflight)
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # клиент -> TokenBucket, давно не активные вытесняются
+        self.inflight = {endpoint: 0 for endpoint in self.max_inflight}
+        self.stats = {"admitted": 0, "rate_limited": 0, "overloaded": 0, "too_large": 0}
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client)
+        return bucket
+
+    def check_upload(self, size: int = None, duration: float = None):
+        """Проверка заявленного размера и длительности записи до чтения и декодирования"""
+        if size is not None and size > Config.MAX_AUDIO_BYTES:
+            self.stats["too_large"] += 1
+            raise AdmissionRejected(413, "Слишком большой аудиофайл")
+        if duration is not None and duration > Config.MAX_AUDIO_SECONDS:
+            self.stats["too_large"] += 1
+            raise AdmissionRejected(413, "Слишком длинная запись")
+
+    def check_batch(self, size: int = None):
+        """Проверка заявленного размера тела пакетного запроса"""
+        if size is not None and size > Config.MAX_BATCH_BYTES:
+            self.stats["too_large"] += 1
+            raise AdmissionRejected(413, "Слишком большой пакет запросов")
+
+    def check_capacity(self, endpoint: str):
+        """Отказ, если все слоты одновременных запросов эндпоинта заняты"""
+        limit = self.max_inflight.get(endpoint)
+        if limit is not None and self.inflight[endpoint] >= limit:
+            self.stats["overloaded"] += 1
+            raise AdmissionRejected(503, "Сервис перегружен, повторите запрос позже")
+
+    def acquire(self, endpoint: str, client: str = None, rate_limited: bool = True, hold: bool = True):
+        """Допуск запроса; hold=False - только частота клиента, слот эндпоинта занимает обработчик"""
+        # Лимит одновременных запросов проверяется первым, чтобы отказ не расходовал токены клиента
+        limit = self.max_inflight.get(endpoint) if hold else None
+        if limit is not None:
+            self.check_capacity(endpoint)
+
+        if rate_limited and client is not None:
+            wait = self._bucket(client).try_acquire()
+            if wait:
+                self.stats["rate_limited"] += 1
+                raise AdmissionRejected(429, "Слишком много запросов", wait)
+
+        if limit is not None:
+            self.inflight[endpoint] += 1
+        self.stats["admitted"] += 1
+
+    def release(self, endpoint: str):
+        if endpoint in self.inflight:
+            self.inflight[endpoint] -= 1
+
+    @contextmanager
+    def admit(self, endpoint: str, client: str = None, rate_limited: bool = True):
+        self.acquire(endpoint, client, rate_limited)
+        try:
+            yield
+        finally:
+            self.release(endpoint)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, inflight=dict(self.inflight), clients=len(self.buckets))
\ No newline at end of file
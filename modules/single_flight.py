@@ -0,0 +1,37 @@
+from typing import Awaitable, Callable, Dict, Hashable
+import asyncio
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вычислений: первый запрос с ключом
+    запускает вычисление, остальные ожидают его результат"""
+
+    def __init__(self):
+        self._flights = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "errors": 0}
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable]):
+        """Результат compute() для ключа; отмена одного ожидающего не отменяет общее вычисление"""
+        future = self._flights.get(key)
+        if future is None:
+            self.stats["leaders"] += 1
+            future = self._flights[key] = asyncio.ensure_future(compute())
+            future.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        # Ошибка извлекается здесь, даже если все ожидающие были отменены
+        if not future.cancelled() and future.exception() is not None:
+            self.stats["errors"] += 1
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["inflight"] = len(self._flights)
+        return stats
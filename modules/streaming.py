@@ -0,0 +1,113 @@
+from array import array
+from config import Config
+from modules.audio import AudioConverter
+import asyncio
+import math
+import sys
+
+
+class StreamingDecoder:
+    """Инкрементальное декодирование потока webm/opus в PCM через долгоживущий процесс ffmpeg"""
+
+    def __init__(self, sample_rate: int = AudioConverter.SAMPLE_RATE, read_size: int = 4096):
+        self.sample_rate = sample_rate
+        self.read_size = read_size
+        self.process = None
+        self._input_closed = False
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            Config.FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+            "-fflags", "nobuffer", "-i", "pipe:0",
+            "-ac", "1", "-ar", str(self.sample_rate),
+            "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        return self
+
+    async def feed(self, chunk: bytes) -> bool:
+        """Передача очередного фрагмента записи декодеру; False - декодер завершился
+        (например, на некорректных данных) и больше не принимает вход"""
+        if self._input_closed:
+            return False
+        try:
+            self.process.stdin.write(chunk)
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            self._input_closed = True
+            return False
+        return True
+
+    async def close_input(self):
+        """Конец входного потока: ffmpeg допишет остаток и завершится"""
+        if not self._input_closed:
+            self._input_closed = True
+            self.process.stdin.close()
+
+    async def iter_pcm(self):
+        while True:
+            data = await self.process.stdout.read(self.read_size)
+            if not data:
+                break
+            yield data
+
+    async def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+
+
+class VoiceActivityDetector:
+    """Энергетический детектор речи для определения конца высказывания"""
+
+    def __init__(self, sample_rate: int = AudioConverter.SAMPLE_RATE,
+                 frame_ms: int = Config.VAD_FRAME_MS,
+                 threshold: float = Config.VAD_ENERGY_THRESHOLD,
+                 silence_ms: int = Config.VAD_SILENCE_MS,
+                 min_speech_ms: int = Config.VAD_MIN_SPEECH_MS):
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * AudioConverter.SAMPLE_WIDTH
+        self.threshold = threshold
+        self.silence_ms = silence_ms
+        self.min_speech_ms = min_speech_ms
+
+        self.noise_level = 0.0
+        self.speech_ms = 0
+        self.trailing_silence_ms = 0
+        self.in_speech = False
+        self.ended = False
+        self._buffer = bytearray()
+
+    @staticmethod
+    def frame_rms(frame: bytes) -> float:
+        samples = array('h')
+        samples.frombytes(frame)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return math.sqrt(sum(sample * sample for sample in samples) / len(samples)) if samples else 0.0
+
+    def feed(self, pcm: bytes) -> bool:
+        """Обработка очередной порции PCM; True, когда высказывание завершено"""
+        self._buffer.extend(pcm)
+        while not self.ended and len(self._buffer) >= self.frame_bytes:
+            frame = bytes(self._buffer[:self.frame_bytes])
+            del self._buffer[:self.frame_bytes]
+            self._process_frame(self.frame_rms(frame))
+        return self.ended
+
+    def _process_frame(self, rms: float):
+        # Порог адаптируется к уровню фонового шума
+        is_speech = rms > max(self.threshold, self.noise_level * 3)
+        if is_speech:
+            self.speech_ms += self.frame_ms
+            self.trailing_silence_ms = 0
+            if self.speech_ms >= self.min_speech_ms:
+                self.in_speech = True
+        else:
+            self.noise_level = 0.95 * self.noise_level + 0.05 * rms if self.noise_level else rms
+            if self.in_speech:
+                self.trailing_silence_ms += self.frame_ms
+                if self.trailing_silence_ms >= self.silence_ms:
+                    self.ended = True
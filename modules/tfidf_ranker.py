@@ -0,0 +1,138 @@
+from config import Config
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from modules.metrics import ROWS_SCANNED
+
+
+class TfidfRanker:
+    """Векторное ранжирование TF-IDF: разреженная матрица документ-термин с нормированными строками"""
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.matrix = sparse.csc_matrix((0, 0), dtype=np.float32)
+        self.docs = []
+        self._access = np.zeros(0, dtype=np.int64)
+        self._categories = np.zeros(0, dtype=object)
+        self._doc_types = np.zeros(0, dtype=object)
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[Dict, List[str]]]):
+        """Построение из пар (метаданные документа, стеммированные токены)"""
+        ranker = cls()
+        rows, cols, counts = [], [], []
+        for row, (doc, tokens) in enumerate(documents):
+            ranker.docs.append(doc)
+            for term, tf in Counter(tokens).items():
+                col = ranker.vocabulary.setdefault(term, len(ranker.vocabulary))
+                rows.append(row)
+                cols.append(col)
+                counts.append(tf)
+
+        shape = (len(ranker.docs), len(ranker.vocabulary))
+        matrix = sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), (np.asarray(rows), np.asarray(cols))), shape=shape)
+
+        # Сублинейный tf, сглаженный idf и L2-нормировка строк (нормировка по длине документа)
+        df = np.bincount(matrix.indices, minlength=shape[1])
+        ranker.idf = (np.log((1 + shape[0]) / (1 + df)) + 1).astype(np.float32)
+        matrix.data = np.log1p(matrix.data)
+        matrix = matrix.multiply(ranker.idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        matrix = sparse.diags(1 / norms).dot(matrix)
+        # CSC: запрос выбирает лишь столбцы своих терминов
+        ranker.matrix = matrix.astype(np.float32).tocsc()
+
+        ranker._access = np.array([doc["access_id"] for doc in ranker.docs])
+        ranker._categories = np.array([doc["category"] for doc in ranker.docs], dtype=object)
+        ranker._doc_types = np.array([doc["doc_type"] for doc in ranker.docs], dtype=object)
+        return ranker
+
+    def _mask(self, category_code, doc_type_code, access_id) -> Optional[np.ndarray]:
+        """Маска документов, прошедших фильтры; вычисляется один раз для каждого сочетания"""
+        key = (category_code, doc_type_code, access_id)
+        if key not in self._masks:
+            mask = np.ones(len(self.docs), dtype=bool)
+            if access_id is not None:
+                mask &= self._access == access_id
+            if category_code:
+                mask &= self._categories == category_code
+            if doc_type_code:
+                mask &= self._doc_types == doc_type_code
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def _query_matrix(self, token_lists: List[List[str]]):
+        """Матрица запросов термин x запрос с весами tf-idf и единичной нормой столбцов"""
+        rows, cols, weights = [], [], []
+        for col, tokens in enumerate(token_lists):
+            for term, tf in Counter(tokens).items():
+                row = self.vocabulary.get(term)
+                if row is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    weights.append(np.log1p(tf) * self.idf[row])
+        query = sparse.csc_matrix(
+            (np.asarray(weights, dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=(len(self.vocabulary), len(token_lists)))
+        norms = np.sqrt(np.asarray(query.multiply(query).sum(axis=0)).ravel())
+        norms[norms == 0] = 1.0
+        return query.dot(sparse.diags(1 / norms)).tocsc()
+
+    def search(self, query_tokens: List[str], category_code: Optional[str] = None,
+               doc_type_code: Optional[str] = None, access_id: Optional[int] = 1,
+               limit: int = Config.SEARCH_LIMIT) -> List[Dict]:
+        """Поиск одного запроса: сумма взвешенных столбцов матрицы без построения матрицы запроса"""
+        weights = {}
+        for term, tf in Counter(query_tokens).items():
+            col = self.vocabulary.get(term)
+            if col is not None:
+                weights[col] = np.log1p(tf) * self.idf[col]
+        if not weights:
+            return []
+
+        norm = np.sqrt(sum(weight * weight for weight in weights.values()))
+        indptr, indices, data = self.matrix.indptr, self.matrix.indices, self.matrix.data
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        scanned = 0
+        for col, weight in weights.items():
+            start, end = indptr[col], indptr[col + 1]
+            # В пределах столбца строки уникальны, поэтому сложение по индексам корректно
+            scores[indices[start:end]] += data[start:end] * (weight / norm)
+            scanned += end - start
+        ROWS_SCANNED.inc(int(scanned), backend="tfidf")
+        return self._top(scores, category_code, doc_type_code, access_id, limit)
+
+    def search_batch(self, token_lists: List[List[str]], category_code: Optional[str] = None,
+                     doc_type_code: Optional[str] = None, access_id: Optional[int] = 1,
+                     limit: int = Config.SEARCH_LIMIT) -> List[List[Dict]]:
+        """Косинусная близость всех документов ко всем запросам одним разреженным умножением"""
+        if not self.docs or not token_lists:
+            return [[] for _ in token_lists]
+
+        query = self._query_matrix(token_lists)
+        terms = np.unique(query.indices)
+        # Участвуют только столбцы терминов запросов: (документы x термины) @ (термины x запросы)
+        columns = self.matrix[:, terms]
+        scores = (columns @ query[terms, :]).toarray()
+        ROWS_SCANNED.inc(int(columns.nnz), backend="tfidf")
+        return [self._top(column, category_code, doc_type_code, access_id, limit) for column in scores.T]
+
+    def _top(self, scores: np.ndarray, category_code, doc_type_code, access_id, limit: int) -> List[Dict]:
+        scores = np.where(self._mask(category_code, doc_type_code, access_id), scores, 0.0)
+        k = min(limit, len(scores))
+        # Частичная сортировка: argpartition отбирает k лучших, сортируются только они
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self._result(position, float(scores[position])) for position in top if scores[position] > 0]
+
+    def _result(self, position: int, score: float) -> Dict:
+        doc = self.docs[position]
+        return {"id": doc["id"], "title": doc["title"], "url": doc["url"], "score": score}
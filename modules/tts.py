@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from config import Config
+from modules.executors import StageOverloaded
+from typing import Dict, Iterable
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+
+
+class AudioCache:
+    """Кэш синтезированного аудио по хешу текста с ограничением суммарного размера"""
+
+    def __init__(self, max_bytes: int = Config.TTS_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        params = f"{Config.VOICE_RATE}|{Config.VOICE_VOLUME}|{text}"
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = audio
+            self.size += len(audio)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self.size)
+
+
+class TTSWorker:
+    """Отдельный поток синтеза речи: движок pyttsx3 живет и используется только в нем"""
+
+    def __init__(self, cache: AudioCache = None, max_queue: int = Config.TTS_QUEUE_SIZE):
+        self.cache = cache or AudioCache()
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}  # ключ -> Future рендера, чтобы не синтезировать одно и то же дважды
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def render(self, text: str) -> Future:
+        """Синтез текста в аудио (WAV); готовый результат берется из кэша"""
+        key = AudioCache.make_key(text)
+        audio = self.cache.get(key)
+        if audio is not None:
+            future = Future()
+            future.set_result(audio)
+            return future
+
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            try:
+                self.queue.put_nowait(("render", text, key, future))
+            except queue.Full:
+                raise StageOverloaded("tts")
+            self._pending[key] = future
+            return future
+
+    def speak(self, text: str) -> bool:
+        """Воспроизведение на сервере без ожидания окончания"""
+        try:
+            self.queue.put_nowait(("speak", text, None, None))
+            return True
+        except queue.Full:
+            return False
+
+    def prerender(self, texts: Iterable[str]):
+        """Заблаговременный синтез частых фиксированных ответов"""
+        for text in texts:
+            try:
+                self.render(text)
+            except StageOverloaded:
+                break
+
+    def _run(self):
+        engine = None
+        try:
+            import pyttsx3
+            engine = pyttsx3.init()
+            engine.setProperty('rate', Config.VOICE_RATE)
+            engine.setProperty('volume', Config.VOICE_VOLUME)
+        except Exception as e:
+            print(f"Ошибка инициализации синтезатора речи: {e}")
+
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            action, text, key, future = job
+            try:
+                if engine is None:
+                    raise RuntimeError("Синтезатор речи недоступен")
+                if action == "speak":
+                    engine.say(text)
+                    engine.runAndWait()
+                else:
+                    audio = self._render(engine, text)
+                    self.cache.put(key, audio)
+                    future.set_result(audio)
+            except Exception as e:
+                if future is not None:
+                    future.set_exception(e)
+                else:
+                    print(f"Ошибка синтеза речи: {e}")
+            finally:
+                if key is not None:
+                    with self._lock:
+                        self._pending.pop(key, None)
+
+    @staticmethod
+    def _render(engine, text: str) -> bytes:
+        # pyttsx3 умеет сохранять только в файл: файл удаляется сразу после чтения
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.unlink(path)
@@ -1,9 +1,9 @@
 import speech_recognition as sr
-import pyttsx3
 from config import Config
+from modules.asr import create_asr_backend
+from modules.tts import TTSWorker
+from typing import List
 import os
-from pydub import AudioSegment
-from pydub.playback import play
 import tempfile
 import time
 import atexit
@@ -12,7 +12,8 @@ class VoiceIO:
     def __init__(self):
         self.recognizer = sr.Recognizer()
         self.recognizer.pause_threshold = 0.8
-        self.engine = None
+        self.asr = create_asr_backend()
+        self.tts = TTSWorker()
 
         self._temp_files = []
         atexit.register(self._cleanup_temp_files)
@@ -24,15 +25,7 @@ class VoiceIO:
                     os.unlink(file_path)
             except Exception as e:
                 print(f"Failed to delete temp file {file_path}: {e}")
-        
-        if Config.VOICE_ENABLED:
-            try:
-                self.engine = pyttsx3.init()
-                self.engine.setProperty('rate', Config.VOICE_RATE)
-                self.engine.setProperty('volume', Config.VOICE_VOLUME)
-            except Exception as e:
-                print(f"Ошибка инициализации синтезатора речи: {e}")
-                self.engine = None
+        self.tts.stop()
     
     def listen(self) -> str:
         """Запись голоса с микрофона и преобразование в текст"""
@@ -41,7 +34,7 @@ class VoiceIO:
             audio = self.recognizer.listen(source)
         
         try:
-            text = self.recognizer.recognize_google(audio, language="ru-RU")
+            text = self.transcribe(audio)
             print(f"Распознано: {text}")
             return text
         except sr.UnknownValueError:
@@ -51,16 +44,24 @@ class VoiceIO:
             print(f"Ошибка сервиса распознавания: {e}")
             return ""
     
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """Распознавание записи выбранным движком (Config.ASR_BACKEND)"""
+        return self.asr.transcribe(audio)
+    
+    def transcribe_batch(self, audios: List[sr.AudioData]) -> List[str]:
+        return self.asr.transcribe_batch(audios)
+    
     def speak(self, text: str):
-        """Озвучивание текста"""
-        if not Config.VOICE_ENABLED or not self.engine:
+        """Озвучивание текста в фоновом потоке синтеза, без ожидания окончания"""
+        if not Config.VOICE_ENABLED:
             return
-        
-        try:
-            self.engine.say(text)
-            self.engine.runAndWait()
-        except Exception as e:
-            print(f"Ошибка синтеза речи: {e}")
+        self.tts.start()
+        if not self.tts.speak(text):
+            print("Очередь синтеза речи переполнена")
+    
+    def synthesize(self, text: str):
+        """Синтез текста в аудио (Future с байтами WAV)"""
+        return self.tts.start().render(text)
     
     def play_notification_sound(self, sound_type: str = "start"):
         """Воспроизведение звукового уведомления"""
@@ -68,6 +69,8 @@ class VoiceIO:
         
         if os.path.exists(sound_path):
             try:
+                from pydub import AudioSegment
+                from pydub.playback import play
                 sound = AudioSegment.from_mp3(sound_path)
                 play(sound)
             except Exception as e: